@@ -0,0 +1,3 @@
+"""
+Benchmark suites of the feature selection methods and the synthetic data generators
+"""
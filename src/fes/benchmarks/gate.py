@@ -0,0 +1,178 @@
+import argparse
+import json
+from pathlib import Path
+
+from sklearn.tree import DecisionTreeRegressor
+
+from fes.benchmarks.runner import measure_time, measure_peak_memory, get_commit, get_machine, to_json
+from fes.benchmarks.suites import quiet, SEED
+from fes.methods.iht import make_engine, run_iht
+from fes.methods.permutation_importance import permutation_importance
+from fes.pipelines.data_processing.nodes import DATA_VERSION, generate_sparse_data
+from fes.pipelines.data_science.nodes import fit_model
+
+"""
+Performance regression gate: reruns a fixed set of canonical problems and compares their wall time,
+iterations to converge and peak memory against a committed baseline
+"""
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Relative increase of every metric over the baseline that counts as a regression, None for the advisory metrics
+# that are only reported. The iterations and the traced memory are deterministic, wall times on shared machines
+# vary by a third between runs even as the fastest of several timings, so they are only gated when asked for
+THRESHOLDS = dict(time=None, n_iter=0.1, peak_memory=0.1)
+
+PROBLEMS = {
+    'l0_reg_wide': dict(method='l0_reg', n=200, m=2000, k=50, noise_std=1, poly_degree=1),
+    'l0_reg_tall': dict(method='l0_reg', n=2000, m=500, k=50, noise_std=1, poly_degree=1),
+    'l0_reg_noisy_poly': dict(method='l0_reg', n=500, m=1000, k=100, noise_std=6, poly_degree=3),
+    'l0_reg_ar1': dict(method='l0_reg', n=500, m=1000, k=50, noise_std=1, poly_degree=1, correlation='ar1', rho=0.8),
+    'perm_importance_linear': dict(method='perm_importance', n=1000, m=500, noise_std=1, poly_degree=1),
+    'perm_importance_batched_tree': dict(method='perm_importance_batched', n=200, m=50, noise_std=1, poly_degree=1),
+}
+
+
+def run_problem(method, n, m, noise_std, poly_degree, k=None, correlation=None, rho=0., repeat=5):
+    """
+    Returns the metrics of the method on the canonical problem: time, peak_memory and, for IHT, n_iter
+    """
+    y, X, _, _, _ = quiet(generate_sparse_data, n, m, noise_std, redundancy_rate=0.9, features_fill='normal',
+                          poly_degree=poly_degree, seed=SEED, correlation=correlation, rho=rho, n_workers=1)
+
+    if method == 'l0_reg':
+        def solve():
+            return quiet(run_iht, make_engine(X, y), k, tol=1e-3, max_iter=1000, strict=False)
+
+        metrics = dict(n_iter=solve()[3])
+
+    elif method == 'perm_importance':
+        regressor = fit_model(y, X)
+
+        def solve():
+            return permutation_importance(regressor, X, y, n_repeats=30, random_state=SEED)
+
+        metrics = dict()
+
+    elif method == 'perm_importance_batched':
+        regressor = DecisionTreeRegressor(random_state=SEED).fit(X, y.reshape(-1))
+
+        def solve():
+            return permutation_importance(regressor, X, y, n_repeats=5, random_state=SEED, batched=True)
+
+        metrics = dict()
+
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    metrics.update(time=measure_time(solve, repeat=repeat, min_time=0.2), peak_memory=measure_peak_memory(solve))
+
+    return metrics
+
+
+def run_gate(problems=None, repeat=5):
+    """
+    Returns the metrics of every canonical problem
+    """
+    problems = PROBLEMS if problems is None else problems
+
+    return {name: run_problem(**problem, repeat=repeat) for name, problem in problems.items()}
+
+
+def compare(metrics, baseline, thresholds=None):
+    """
+    Returns the regressions as (problem, metric, baseline value, value) tuples: the metrics that exceed their
+    baseline by more than their threshold. Advisory metrics, whose threshold is None, and problems and metrics
+    missing from the baseline are not compared
+    """
+    thresholds = dict(THRESHOLDS, **(thresholds or {}))
+
+    regressions = []
+
+    for name, problem_metrics in metrics.items():
+        for metric, value in problem_metrics.items():
+            base = baseline.get(name, {}).get(metric)
+
+            threshold = thresholds[metric]
+
+            if base is not None and threshold is not None and value > base * (1 + threshold):
+                regressions.append((name, metric, base, value))
+
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    Returns the metrics of the baseline. Raises RuntimeError if it was measured on synthetic data of another
+    version: the canonical problems changed, so their metrics aren't comparable
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+
+    if baseline.get('data_version') != DATA_VERSION:
+        raise RuntimeError(f"The baseline is stale: it was measured on synthetic data version "
+                           f"{baseline.get('data_version')}, the generators are at version {DATA_VERSION}. "
+                           f"Rerun the gate with --update")
+
+    return baseline['metrics']
+
+
+def save_baseline(metrics, path=BASELINE_PATH):
+    with open(path, 'w') as f:
+        json.dump(dict(commit=get_commit(), machine=get_machine(), data_version=DATA_VERSION, metrics=metrics), f,
+                  indent=2, default=to_json)
+
+
+def format_metric(metric, value, base=None, advisory=False):
+    """
+    Formats the metric with its change over the baseline, if any, and whether it is only reported
+    """
+    change = f" ({value / base - 1:+.0%}{', advisory' if advisory else ''})" if base else ""
+
+    return f"{metric} {value:.4g}{change}"
+
+
+def main(argv=None):
+    """
+    Runs the gate and returns the regressions, or stores the metrics as the new baseline with --update.
+    Raises RuntimeError if the baseline was measured on another version of the synthetic data
+    """
+    parser = argparse.ArgumentParser(description="Compares the canonical problems against the stored baseline")
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), help="baseline JSON file")
+    parser.add_argument('--update', action='store_true', help="store the metrics as the new baseline")
+    parser.add_argument('--repeat', type=int, default=5, help="number of timings of every problem")
+
+    for metric, threshold in THRESHOLDS.items():
+        default = f"{threshold} by default" if threshold is not None else "only reported by default"
+
+        parser.add_argument(f"--{metric.replace('_', '-')}-threshold", type=float, default=threshold, dest=metric,
+                            help=f"allowed relative increase of {metric}, {default}")
+
+    args = parser.parse_args(argv)
+
+    if args.update:
+        save_baseline(run_gate(repeat=args.repeat), args.baseline)
+        print(f"The baseline is stored in {args.baseline}")
+
+        return []
+
+    # A stale baseline fails before the problems are run
+    baseline = load_baseline(args.baseline)
+    metrics = run_gate(repeat=args.repeat)
+    thresholds = {metric: getattr(args, metric) for metric in THRESHOLDS}
+
+    regressions = compare(metrics, baseline, thresholds)
+
+    for name, problem_metrics in metrics.items():
+        print(f"{name}: " + ", ".join(format_metric(metric, value, baseline.get(name, {}).get(metric),
+                                                    thresholds[metric] is None)
+                                      for metric, value in problem_metrics.items()))
+
+    for name, metric, base, value in regressions:
+        print(f"REGRESSION {name} {metric}: {base:.4g} -> {value:.4g} ({value / base - 1:+.0%})")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if main() else 0)
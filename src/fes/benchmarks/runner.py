@@ -0,0 +1,190 @@
+import argparse
+import inspect
+import itertools
+import json
+import platform
+import re
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from fes.benchmarks import suites
+
+"""
+Offline runner of the asv-style benchmark suites: times and memory-profiles every benchmark over its
+parameter grid and stores the results as one JSON file per commit
+"""
+
+# Anchored to the project root rather than the working directory, the runner is started from src
+RESULTS_DIR = Path(__file__).resolve().parents[3] / "data" / "08_reporting" / "benchmarks"
+
+
+def run_benchmarks(pattern=None, repeat=3, min_time=0.05, module=suites):
+    """
+    Runs every time_* and track_* method of the suites in module whose name Class.method matches pattern
+
+    Parameters
+    ----------
+    pattern: str; regular expression the benchmark names are searched with, all benchmarks by default
+    repeat: int; number of timings of a time_* benchmark, the fastest one is kept
+    min_time: float; fast benchmarks are called in a loop that lasts at least min_time seconds per timing
+    module: module with the suites
+    Returns results: dict; benchmark name to the list of its results, one per combination of the grid
+    -------
+    """
+    results = {}
+
+    for suite_name, suite in inspect.getmembers(module, inspect.isclass):
+        if suite.__module__ != module.__name__:
+            continue
+
+        names = [name for name in dir(suite) if name.startswith(('time_', 'track_'))
+                 and (pattern is None or re.search(pattern, f"{suite_name}.{name}"))]
+
+        if not names:
+            continue
+
+        param_names = getattr(suite, 'param_names', [])
+
+        for params in itertools.product(*getattr(suite, 'params', [])):
+            instance = suite()
+
+            try:
+                if hasattr(instance, 'setup'):
+                    instance.setup(*params)
+
+            except NotImplementedError:
+                continue
+
+            for name in names:
+                method = getattr(instance, name)
+
+                result = dict(params=dict(zip(param_names, params)))
+
+                if name.startswith('time_'):
+                    result.update(time=measure_time(method, params, repeat, min_time),
+                                  peak_memory=measure_peak_memory(method, params))
+                else:
+                    result.update(value=method(*params))
+
+                results.setdefault(f"{suite_name}.{name}", []).append(result)
+
+                print(f"{suite_name}.{name} {format_params(result['params'])}: {format_result(result)}")
+
+    return results
+
+
+def measure_time(func, args=(), repeat=3, min_time=0.05):
+    """
+    Returns the fastest time of func(*args) in seconds out of repeat timings, like timeit: fast functions are
+    timed over a loop of calls that lasts at least min_time
+    """
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+
+    number = max(1, int(np.ceil(min_time / max(elapsed, 1e-9)))) if elapsed < min_time else 1
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        for _ in range(number):
+            func(*args)
+
+        timings.append((time.perf_counter() - start) / number)
+
+    return min(timings)
+
+
+def measure_peak_memory(func, args=()):
+    """
+    Returns the peak number of bytes allocated through Python and numpy during func(*args)
+    """
+    tracemalloc.start()
+
+    try:
+        func(*args)
+
+        return tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+def save_results(results, results_dir=RESULTS_DIR):
+    """
+    Stores the results as <commit>.json in results_dir, with the commit and the machine they were measured on.
+    Results of other benchmarks already stored for the commit are kept, so the suites can be run separately
+    Returns path: Path; the written file
+    -------
+    """
+    commit = get_commit()
+
+    path = Path(results_dir) / f"{commit}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if path.exists():
+        with open(path) as f:
+            results = dict(json.load(f)['results'], **results)
+
+    with open(path, 'w') as f:
+        json.dump(dict(commit=commit, date=datetime.now(timezone.utc).isoformat(), machine=get_machine(),
+                       results=results), f, indent=2, default=to_json)
+
+    return path
+
+
+def get_commit():
+    """
+    Returns the hash of the checked out commit, with a -dirty suffix if the tree has uncommitted changes
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return f"{commit}-dirty" if status else commit
+
+
+def get_machine():
+    return dict(node=platform.node(), processor=platform.processor(), machine=platform.machine(),
+                python=platform.python_version(), numpy=np.__version__)
+
+
+def to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def format_params(params):
+    return ", ".join(f"{name}={value}" for name, value in params.items())
+
+
+def format_result(result):
+    if 'time' in result:
+        return f"{result['time'] * 1e3:.3f} ms, {result['peak_memory'] / 2 ** 20:.2f} MB peak"
+
+    return f"{result['value']}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the benchmark suites and stores the results per commit")
+    parser.add_argument('-b', '--bench', help="regular expression selecting the benchmarks by Class.method")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="number of timings of every benchmark")
+    parser.add_argument('-o', '--output', default=str(RESULTS_DIR), help="directory of the JSON results")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.bench, args.repeat)
+
+    print(f"Results are stored in {save_results(results, args.output)}")
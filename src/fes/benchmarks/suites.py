@@ -0,0 +1,169 @@
+import contextlib
+import io
+
+import numpy as np
+
+from fes.methods.iht import l0_reg, run_iht, iht_step, make_engine, get_topk, get_topk_idx, Workspace
+from fes.pipelines.data_processing.nodes import generate_sparse_data, generate_grouped_data
+from fes.pipelines.data_science.nodes import fit_model, evaluate_perm_importance
+
+"""
+Benchmark suites in the asv format: every class has a grid of params named by param_names, setup is called
+with every combination of the grid, and the time_* methods are timed and the track_* methods return a value
+to record. They run with asv (see asv.conf.json) or offline with python -m fes.benchmarks
+"""
+
+SEED = 54
+
+
+def quiet(func, *args, **kwargs):
+    """
+    Calls func with its prints discarded
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def sparse_data(n, m, noise_std, poly_degree):
+    return quiet(generate_sparse_data, n, m, noise_std, redundancy_rate=0.9, features_fill='normal',
+                 poly_degree=poly_degree, seed=SEED, n_workers=1)
+
+
+class L0Reg:
+    params = [[100, 1000], [200, 2000], [10, 100], [1, 6], [1, 3]]
+    param_names = ['n', 'm', 'k', 'noise_std', 'poly_degree']
+
+    tol = 1e-3
+    max_iter = 1000
+
+    def setup(self, n, m, k, noise_std, poly_degree):
+        self.y, self.X, _, _, _ = sparse_data(n, m, noise_std, poly_degree)
+
+    def time_l0_reg(self, n, m, k, noise_std, poly_degree):
+        try:
+            quiet(l0_reg, self.X, self.y, k, tol=self.tol, max_iter=self.max_iter)
+
+        except RuntimeError:
+            # The time of max_iter iterations is still the time it takes
+            pass
+
+    def track_iterations(self, n, m, k, noise_std, poly_degree):
+        _, _, _, n_iter = quiet(run_iht, make_engine(self.X, self.y), k, tol=self.tol, max_iter=self.max_iter,
+                                strict=False)
+
+        return n_iter
+
+
+class IHTMethods:
+    params = [[200, 1000], [500, 2000], [20, 100], [None, 'ar1'], ['niht', 'aiht', 'cgiht', 'htp']]
+    param_names = ['n', 'm', 'k', 'correlation', 'method']
+
+    tol = 1e-3
+    max_iter = 1000
+
+    def setup(self, n, m, k, correlation, method):
+        self.y, self.X, _, _, _ = quiet(generate_sparse_data, n, m, 1, redundancy_rate=0.9, features_fill='normal',
+                                        poly_degree=1, seed=SEED, correlation=correlation, rho=0.9, n_workers=1)
+
+    def time_run_iht(self, n, m, k, correlation, method):
+        quiet(run_iht, make_engine(self.X, self.y), k, tol=self.tol, max_iter=self.max_iter, strict=False,
+              method=method)
+
+    def track_iterations(self, n, m, k, correlation, method):
+        _, _, _, n_iter = quiet(run_iht, make_engine(self.X, self.y), k, tol=self.tol, max_iter=self.max_iter,
+                                strict=False, method=method)
+
+        return n_iter
+
+
+class IHTStepSizes:
+    params = [[200, 1000], [500, 2000], [20, 100], [None, 'ar1'], ['normalized', 'lipschitz']]
+    param_names = ['n', 'm', 'k', 'correlation', 'step_size']
+
+    tol = 1e-3
+    max_iter = 1000
+
+    def setup(self, n, m, k, correlation, step_size):
+        self.y, self.X, _, _, _ = quiet(generate_sparse_data, n, m, 1, redundancy_rate=0.9, features_fill='normal',
+                                        poly_degree=1, seed=SEED, correlation=correlation, rho=0.9, n_workers=1)
+
+    def time_run_iht(self, n, m, k, correlation, step_size):
+        # A new engine every time, so the estimate of ||X||_2^2 is timed too
+        quiet(run_iht, make_engine(self.X, self.y), k, tol=self.tol, max_iter=self.max_iter, strict=False,
+              step_size=step_size)
+
+    def track_iterations(self, n, m, k, correlation, step_size):
+        _, _, _, n_iter = quiet(run_iht, make_engine(self.X, self.y), k, tol=self.tol, max_iter=self.max_iter,
+                                strict=False, step_size=step_size)
+
+        return n_iter
+
+
+class IHTStep:
+    params = [[100, 1000], [200, 2000, 20000], [10, 100], ['direct', 'gram']]
+    param_names = ['n', 'm', 'k', 'engine']
+
+    def setup(self, n, m, k, engine):
+        if engine == 'gram' and m > 2000:
+            raise NotImplementedError("The Gram matrix of this size isn't worth benchmarking")
+
+        y, X, _, _, _ = sparse_data(n, m, 1, 1)
+
+        self.engine = make_engine(X, y, engine)
+        self.workspace = Workspace(self.engine)
+
+        # The first step from the zero iterate on the largest correlations, as run_iht takes it
+        self.idx = get_topk_idx(self.engine.Xty, k, self.workspace)
+        self.w = np.zeros((k, 1))
+        self.Xw = self.engine.product(self.idx, self.w, out=self.workspace.Xw_prev)
+
+    def time_iht_step(self, n, m, k, engine):
+        iht_step(self.engine, self.idx, self.w, self.Xw, len(self.idx), 0, 50, self.workspace)
+
+
+class TopK:
+    params = [[10 ** 3, 10 ** 5, 10 ** 6], [10, 1000]]
+    param_names = ['m', 'k']
+
+    def setup(self, m, k):
+        self.v = np.random.default_rng(SEED).standard_normal((m, 1))
+        self.workspace = Workspace(make_engine(np.zeros((1, m)), np.zeros((1, 1)), 'direct'))
+
+    def time_get_topk(self, m, k):
+        get_topk(self.v, k)
+
+    def time_get_topk_idx(self, m, k):
+        get_topk_idx(self.v, k, self.workspace)
+
+
+class PermImportance:
+    params = [[100, 1000], [200, 1000], [1, 6], [1, 3]]
+    param_names = ['n', 'm', 'noise_std', 'poly_degree']
+
+    def setup(self, n, m, noise_std, poly_degree):
+        self.data = sparse_data(n, m, noise_std, poly_degree)
+        self.regressor = fit_model(self.data[0], self.data[1])
+
+        self.parameters = dict(explanation_rate=0.95, n_repeats=30, n_jobs=None, batched=False, seed=SEED,
+                               evaluation_params_list=dict(perm_importance=['explanation_rate', 'n_repeats', 'n_jobs',
+                                                                            'batched', 'seed']))
+
+    def time_evaluate_perm_importance(self, n, m, noise_std, poly_degree):
+        quiet(evaluate_perm_importance, self.regressor, *self.data, self.parameters)
+
+
+class Generators:
+    params = [[1000, 10000], [200, 2000], [1, 6], [1, 3]]
+    param_names = ['n', 'm', 'noise_std', 'poly_degree']
+
+    def time_generate_sparse_data(self, n, m, noise_std, poly_degree):
+        sparse_data(n, m, noise_std, poly_degree)
+
+
+class GroupedGenerators:
+    params = [[1000, 10000], [200, 2000], [1, 6], [10, 100]]
+    param_names = ['n', 'm', 'noise_std', 'num_groups']
+
+    def time_generate_grouped_data(self, n, m, noise_std, num_groups):
+        quiet(generate_grouped_data, n, m, noise_std, redundancy_rate=0.9, features_fill='normal',
+              num_groups=num_groups, seed=SEED, n_workers=1)
@@ -76,6 +76,13 @@ PARAMS_ARG_HELP = """Specify extra parameters that you want to pass
 to the context initializer. Items must be separated by comma, keys - by colon,
 example: param1:value1,param2:value2. Each parameter is split by the first comma,
 so parameter values are allowed to contain colons, parameter keys are not."""
+BASELINE_ARG_HELP = """JSON file of the baseline metrics of the performance gate.
+If not set, the baseline committed with the benchmarks is used."""
+UPDATE_ARG_HELP = """Store the measured metrics as the new baseline
+instead of comparing them with it."""
+THRESHOLD_ARG_HELP = """Allowed relative increase of the metric over the baseline."""
+TIME_THRESHOLD_ARG_HELP = """Allowed relative increase of the wall time over the baseline.
+If not set, the wall times are only reported, they are too noisy to gate on by default."""
 
 
 def _config_file_callback(ctx, param, value):  # pylint: disable=unused-argument
@@ -246,6 +253,51 @@ def run(
         )
 
 
+@cli.command(name="perf-gate")
+@click.option(
+    "--baseline", type=click.Path(dir_okay=False), default=None, help=BASELINE_ARG_HELP
+)
+@click.option("--update", is_flag=True, help=UPDATE_ARG_HELP)
+@click.option(
+    "--time-threshold", type=float, default=None, help=TIME_THRESHOLD_ARG_HELP
+)
+@click.option(
+    "--n-iter-threshold", type=float, default=None, help=THRESHOLD_ARG_HELP
+)
+@click.option(
+    "--peak-memory-threshold", type=float, default=None, help=THRESHOLD_ARG_HELP
+)
+def perf_gate(
+    baseline, update, time_threshold, n_iter_threshold, peak_memory_threshold
+):
+    """Rerun the canonical problems and fail on a performance regression."""
+    from fes.benchmarks import gate  # pylint: disable=import-outside-toplevel
+
+    argv = ["--baseline", baseline] if baseline else []
+    argv += ["--update"] if update else []
+
+    thresholds = [
+        ("time", time_threshold),
+        ("n-iter", n_iter_threshold),
+        ("peak-memory", peak_memory_threshold),
+    ]
+
+    for name, threshold in thresholds:
+        if threshold is not None:
+            argv += [f"--{name}-threshold", str(threshold)]
+
+    try:
+        regressions = gate.main(argv)
+    except RuntimeError as error:
+        raise KedroCliError(str(error)) from error
+
+    if regressions:
+        raise KedroCliError(
+            f"{len(regressions)} metrics regressed past their threshold: "
+            + ", ".join(f"{name} {metric}" for name, metric, _, _ in regressions)
+        )
+
+
 cli.add_command(pipeline_group)
 cli.add_command(catalog_group)
 cli.add_command(jupyter_group)
@@ -1,16 +1,130 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
 from typing import Dict, Any
+
+import numpy as np
 from kedro.io.core import AbstractDataSet
 
+# Version of the generated data, part of every cache key, so that the datasets cached before a change
+# of the generators aren't served any more
+from fes.pipelines.data_processing.nodes import DATA_VERSION as VERSION
+
 
 class SyntheticDataset(AbstractDataSet):
-    def __init__(self):
-        pass
+    """
+    Content addressed cache of synthetic datasets. Every generated dataset is stored as raw .npy files
+    in its own directory, named by the hash of the generator name, the generation parameters and VERSION,
+    and is loaded back as read-only memory maps, so nothing is read from disk until it is used.
+
+    A node can't both load and save the same data set, so load() returns the cache itself and the
+    generation nodes go through get_or_generate, which only calls the generator on a cache miss.
+    save() stores a (generator name, parameters, dict of arrays) triple directly.
+    Datasets generated without a seed are not reproducible and are never cached
+
+    Parameters
+    ----------
+    filepath: str; directory of the cache
+    mmap_mode: str; mode of np.load for the cached arrays, None loads them into memory
+    """
+
+    def __init__(self, filepath: str, mmap_mode: str = 'r'):
+        self._filepath = Path(filepath)
+        self._mmap_mode = mmap_mode
+
+    def get_or_generate(self, generate, parameters: Dict[str, Any], names):
+        """
+        Returns the outputs of generate(**parameters), from the cache if they were generated before
+
+        Parameters
+        ----------
+        generate: function generating the dataset
+        parameters: dict; keyword arguments of generate
+        names: list; names of the outputs of generate
+        """
+        if parameters.get('seed') is None:
+            return generate(**parameters)
+
+        arrays = self.get(generate.__name__, parameters)
+
+        if arrays is None:
+            arrays = dict(zip(names, generate(**parameters)))
+
+            self.put(generate.__name__, parameters, arrays)
+
+            # The cached copies are returned so that a cold run hands the same memory maps downstream as a warm one
+            arrays = self.get(generate.__name__, parameters)
+
+        else:
+            print(f"The synthetic dataset is loaded from {self.get_path(generate.__name__, parameters)}", end='\n\n')
+
+        return tuple(arrays[name] for name in names)
+
+    def get(self, generator: str, parameters: Dict[str, Any]):
+        """
+        Returns the dict of cached arrays, None if they are not in the cache
+        """
+        path = self.get_path(generator, parameters)
+
+        if not (path / 'manifest.json').exists():
+            return None
+
+        with open(path / 'manifest.json') as f:
+            names = json.load(f)['names']
+
+        return {name: np.load(path / f"{name}.npy", mmap_mode=self._mmap_mode) for name in names}
+
+    def put(self, generator: str, parameters: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        """
+        Stores the arrays. They are written into a temporary directory which is then renamed,
+        so that concurrent runs never see a partially written dataset
+        """
+        path = self.get_path(generator, parameters)
+
+        tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+        tmp_path.mkdir(parents=True, exist_ok=True)
+
+        for name, array in arrays.items():
+            np.save(tmp_path / f"{name}.npy", np.asarray(array))
+
+        # The manifest is written last, it marks the dataset as complete
+        with open(tmp_path / 'manifest.json', 'w') as f:
+            json.dump({'generator': generator, 'version': VERSION, 'parameters': parameters, 'names': list(arrays)}, f,
+                      indent=2)
+
+        try:
+            os.rename(tmp_path, path)
+
+        except OSError:
+            # Another run has stored the same dataset in the meantime
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def get_path(self, generator: str, parameters: Dict[str, Any]) -> Path:
+        return self._filepath / get_key(generator, parameters)
 
     def _load(self) -> Any:
-        pass
+        return self
 
     def _save(self, data: Any) -> None:
-        pass
+        generator, parameters, arrays = data
+
+        self.put(generator, parameters, arrays)
+
+    def _exists(self) -> bool:
+        return self._filepath.exists()
 
     def _describe(self) -> Dict[str, Any]:
-        pass
+        return dict(filepath=str(self._filepath), mmap_mode=self._mmap_mode)
+
+
+def get_key(generator: str, parameters: Dict[str, Any], version: int = VERSION) -> str:
+    """
+    Returns the hash of the generator name, the parameters and the version of the generated data,
+    which doesn't depend on the order of the parameters
+    """
+    content = json.dumps({'generator': generator, 'version': version, 'parameters': parameters}, sort_keys=True,
+                         default=str)
+
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
@@ -27,13 +27,43 @@
 # limitations under the License.
 
 """Project hooks."""
+import csv
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
 from typing import Any, Dict, Iterable, Optional
 
+import numpy as np
 from kedro.config import ConfigLoader
 from kedro.framework.hooks import hook_impl
 from kedro.io import DataCatalog
+from kedro.pipeline.node import Node
 from kedro.versioning import Journal
 
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Not available on Windows, the peak RSS isn't recorded there
+    resource = None
+
+# Anchored to the project root rather than the working directory of the run
+PROFILES_DIR = Path(__file__).resolve().parents[2] / "data" / "08_reporting" / "profiles"
+
+PROFILE_FIELDS = [
+    "run_id",
+    "pipeline_name",
+    "node",
+    "wall_time",
+    "cpu_time",
+    "tracemalloc_peak",
+    "max_rss",
+    "max_rss_increase",
+    "input_bytes",
+    "output_bytes",
+]
+
 
 class ProjectHooks:
     @hook_impl
@@ -54,3 +84,211 @@ class ProjectHooks:
         return DataCatalog.from_config(
             catalog, credentials, load_versions, save_version, journal
         )
+
+
+class ProfilingHooks:
+    """
+    Records the wall time, the CPU time, the tracemalloc peak, the peak RSS and
+    the sizes of the input and output datasets of every node. Every run is stored
+    as <run_id>.json in output_dir and its nodes are appended to nodes.csv there,
+    so the hot nodes of many runs can be found with a single read.
+
+    The hook is enabled by enabled=True in settings.HOOKS, or for a single run by
+    kedro run --params profile:1. CPU time and memory are measured for the whole
+    process, so they are only attributed to single nodes with the SequentialRunner.
+    Nodes run by the ParallelRunner in other processes aren't recorded
+
+    Parameters
+    ----------
+    enabled: bool; profiles every run, otherwise only the runs with the profile
+        parameter set
+    trace_memory: bool; records the peak of the memory allocated through Python
+        and numpy with tracemalloc, which slows down allocation heavy nodes
+    output_dir: str; directory of the profiles
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        trace_memory: bool = True,
+        output_dir: str = str(PROFILES_DIR),
+    ):
+        self._enabled = enabled
+        self._trace_memory = trace_memory
+        self._output_dir = Path(output_dir)
+        self._active = False
+        self._run = {}
+        self._records = []
+        self._started = {}
+        self._stop_tracing = False
+        self._run_start = None
+
+    @hook_impl
+    def before_pipeline_run(self, run_params: Dict[str, Any]):
+        extra_params = run_params.get("extra_params") or {}
+
+        self._active = self._enabled or bool(extra_params.get("profile"))
+
+        if not self._active:
+            return
+
+        self._run = dict(
+            run_id=run_params.get("run_id"),
+            pipeline_name=run_params.get("pipeline_name") or "__default__",
+            extra_params=extra_params,
+        )
+        self._records = []
+        self._started = {}
+
+        self._stop_tracing = self._trace_memory and not tracemalloc.is_tracing()
+
+        if self._stop_tracing:
+            tracemalloc.start()
+
+        self._run_start = time.perf_counter()
+
+    @hook_impl
+    def before_node_run(self, node: Node, inputs: Dict[str, Any]):
+        if not self._active:
+            return
+
+        if tracemalloc.is_tracing():
+            reset_traced_peak()
+
+        self._started[node.name] = (
+            time.perf_counter(),
+            time.process_time(),
+            get_max_rss(),
+            {name: get_size(data) for name, data in inputs.items()},
+        )
+
+    @hook_impl
+    def after_node_run(self, node: Node, outputs: Dict[str, Any]):
+        if not self._active or node.name not in self._started:
+            return
+
+        wall_start, cpu_start, max_rss_start, input_sizes = self._started.pop(node.name)
+
+        max_rss = get_max_rss()
+
+        self._records.append(
+            dict(
+                node=node.name,
+                wall_time=time.perf_counter() - wall_start,
+                cpu_time=time.process_time() - cpu_start,
+                tracemalloc_peak=tracemalloc.get_traced_memory()[1]
+                if tracemalloc.is_tracing()
+                else None,
+                max_rss=max_rss,
+                max_rss_increase=None if max_rss is None else max_rss - max_rss_start,
+                inputs=input_sizes,
+                outputs={name: get_size(data) for name, data in outputs.items()},
+            )
+        )
+
+    @hook_impl
+    def after_pipeline_run(self):
+        if self._active:
+            self._write(status="completed")
+
+    @hook_impl
+    def on_pipeline_error(self, error: Exception):
+        if self._active:
+            self._write(status=f"failed: {error!r}")
+
+    def _write(self, status: str):
+        """
+        Stores the profile of the run and appends its nodes to the CSV
+        """
+        if self._stop_tracing:
+            tracemalloc.stop()
+
+        self._active = False
+
+        profile = dict(
+            self._run,
+            status=status,
+            wall_time=time.perf_counter() - self._run_start,
+            max_rss=get_max_rss(),
+            nodes=self._records,
+        )
+
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+
+        run_name = self._run["run_id"] or time.strftime("%Y-%m-%dT%H.%M.%S")
+
+        with open(self._output_dir / f"{run_name}.json", "w") as f:
+            json.dump(profile, f, indent=2, default=str)
+
+        csv_path = self._output_dir / "nodes.csv"
+        write_header = not csv_path.exists()
+
+        with open(csv_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, PROFILE_FIELDS)
+
+            if write_header:
+                writer.writeheader()
+
+            for record in self._records:
+                writer.writerow(
+                    dict(
+                        run_id=self._run["run_id"],
+                        pipeline_name=self._run["pipeline_name"],
+                        node=record["node"],
+                        wall_time=record["wall_time"],
+                        cpu_time=record["cpu_time"],
+                        tracemalloc_peak=record["tracemalloc_peak"],
+                        max_rss=record["max_rss"],
+                        max_rss_increase=record["max_rss_increase"],
+                        input_bytes=sum(record["inputs"].values()),
+                        output_bytes=sum(record["outputs"].values()),
+                    )
+                )
+
+
+def reset_traced_peak():
+    """
+    Makes the tracemalloc peak start from the memory currently allocated. Before
+    Python 3.9 the traces are cleared instead, so the peak counts only the memory
+    allocated from now on
+    """
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.clear_traces()
+
+
+def get_max_rss() -> Optional[int]:
+    """
+    Returns the peak resident set size of the process in bytes, None where it
+    isn't available
+    """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def get_size(data: Any) -> int:
+    """
+    Returns the number of bytes of the data of a dataset: the buffer of arrays,
+    the deep memory usage of data frames, the sum over the items of containers
+    and sys.getsizeof of anything else
+    """
+    if isinstance(data, np.ndarray):
+        return int(data.nbytes)
+
+    if hasattr(data, "memory_usage"):
+        usage = data.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+
+    if isinstance(data, dict):
+        return sum(get_size(value) for value in data.values())
+
+    if isinstance(data, (list, tuple)):
+        return sum(get_size(value) for value in data)
+
+    return sys.getsizeof(data)
@@ -0,0 +1,143 @@
+import numpy as np
+
+"""
+Design matrix operators processed in blocks of rows, the base of the out-of-core, implicit and partitioned ones
+"""
+
+
+class RowBlockDesign:
+    """
+    Design matrix that is processed in blocks of rows instead of being held as an array.
+    Supports X @ w, X.T @ r, X.T @ X, column gathers X[:, idx] and support products X[:, idx] @ w,
+    so it can be passed to l0_reg, l0_path, l0_reg_multi and sght_reg in place of a numpy array.
+
+    Subclasses set shape and dtype and implement iter_blocks, plus map_blocks if the blocks can be processed
+    in parallel. The products run over the blocks with map_blocks, so the designs whose blocks live elsewhere,
+    e.g. in worker processes, override the products instead
+    """
+
+    ndim = 2
+
+    @property
+    def T(self):
+        return self.transpose()
+
+    def transpose(self):
+        return TransposedDesign(self)
+
+    def __matmul__(self, w):
+        return self.product(w)
+
+    def __getitem__(self, key):
+        """
+        Column gather X[:, idx]
+        """
+        if not isinstance(key, tuple) or len(key) != 2 or not isinstance(key[0], slice) or key[0] != slice(None):
+            raise IndexError("Only column gathers X[:, idx] are supported")
+
+        return self.gather(key[1])
+
+    def iter_blocks(self):
+        """
+        Yields (start, stop, X_block) for consecutive blocks of rows
+        """
+        raise NotImplementedError
+
+    def map_blocks(self, func, reduce=False):
+        """
+        Calls func(start, stop, X_block) on every block and, if reduce is set, returns the sum of the results
+        """
+        total = None
+
+        for start, stop, X_block in self.iter_blocks():
+            result = func(start, stop, X_block)
+
+            if reduce:
+                total = result if total is None else np.add(total, result, out=total)
+
+        return total
+
+    def product(self, w):
+        """
+        Returns X @ w for m x 1 vector or m x T matrix w
+        """
+        Xw = np.empty((self.shape[0],) + w.shape[1:], dtype=np.result_type(self.dtype, w.dtype))
+
+        def product(start, stop, X_block):
+            np.matmul(X_block, w, out=Xw[start:stop])
+
+        self.map_blocks(product)
+
+        return Xw
+
+    def support_product(self, idx, w):
+        """
+        Returns X[:, idx] @ w without gathering the n x len(idx) columns at once
+        """
+        Xw = np.empty((self.shape[0],) + w.shape[1:], dtype=np.result_type(self.dtype, w.dtype))
+
+        def product(start, stop, X_block):
+            np.matmul(X_block[:, idx], w, out=Xw[start:stop])
+
+        self.map_blocks(product)
+
+        return Xw
+
+    def gather(self, cols):
+        """
+        Returns the columns X[:, cols]
+        """
+        cols = np.arange(self.shape[1])[cols]
+
+        X_cols = np.empty((self.shape[0],) + cols.shape, dtype=self.dtype)
+
+        def gather(start, stop, X_block):
+            X_cols[start:stop] = X_block[:, cols]
+
+        self.map_blocks(gather)
+
+        return X_cols
+
+    def rproduct(self, r):
+        """
+        Returns X.T @ r for n x 1 vector or n x T matrix r
+        """
+        return self.map_blocks(lambda start, stop, X_block: X_block.transpose() @ r[start:stop], reduce=True)
+
+    def gram(self):
+        """
+        Returns X.T @ X, accumulated in float64 since the products of integer blocks would overflow in their dtype
+        """
+        def gram(start, stop, X_block):
+            X_block = X_block.astype(np.float64, copy=False)
+
+            return X_block.transpose() @ X_block
+
+        return self.map_blocks(gram, reduce=True)
+
+
+class TransposedDesign:
+    """
+    X.T for RowBlockDesign X, only supports products
+    """
+
+    def __init__(self, design):
+        self.design = design
+        self.shape = design.shape[::-1]
+        self.dtype = design.dtype
+
+    def transpose(self):
+        return self.design
+
+    @property
+    def T(self):
+        return self.design
+
+    def __matmul__(self, r):
+        """
+        Returns X.T @ r for n x 1 vector or n x T matrix r, or X.T @ X if r is X itself
+        """
+        if r is self.design:
+            return self.design.gram()
+
+        return self.design.rproduct(r)
@@ -1,115 +1,1103 @@
+import weakref
+
 import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+import scipy.sparse.linalg
+
+from fes.methods.telemetry import get_callback, get_timer
 
 """
 The implementation of Normalized Iterative Hard Thresholding algorithms
 """
 
 
-def l0_reg(X, y, k, tol=1e-4, max_iter=100, max_step=50, verbose=False):
+def l0_reg(X, y, k, tol=1e-4, max_iter=100, max_step=50, verbose=False, engine='auto', memory_budget=2 ** 28,
+           w_init=None, callback=None, method='niht', step_size='normalized'):
     """
     L0 penalized least-squares regression with iterative hard thresholding
     Parameters
     ----------
-    X: n x m; design matrix
+    X: n x m; design matrix, dense or scipy.sparse
     y: n x 1; vector of observations
     k: int; desired model (support) size
     tol: float; global tolerance
     max_iter: int; maximum number of iterations for the algorithm
     max_step: int; maximum number of backtracking steps for the step size calculation
     verbose: bool; Log flag
+    engine: str or engine; 'direct', 'gram' or 'auto' (see make_engine) or an already built engine
+    memory_budget: int; maximum number of bytes the Gram matrix is allowed to take when engine is 'auto'
+    w_init: m x 1; vector of weights to warm start from, zeros by default
+    callback: callable; called with the record of every iteration, see fes.methods.telemetry
+    method: str; 'niht' - normalized IHT, 'aiht' - IHT with Nesterov momentum, 'cgiht' - restarted conjugate
+        gradient IHT or 'htp' - hard thresholding pursuit, which refits the least squares on every support.
+        The accelerated methods fall back to a normalized IHT step whenever their step increases the loss
+    step_size: str; 'normalized' - the step is normalized on the support on every iteration, 'lipschitz' - the safe
+        step 0.9 / ||X||_2^2 is taken while the support changes and the normalized one once it stays the same,
+        see LipschitzStep. Only normalized IHT supports the latter
+    """
+    engine = make_engine(X, y, engine, memory_budget)
+
+    w, sup, _, _ = run_iht(engine, k, w_init, tol, max_iter, max_step, verbose, callback=callback, method=method,
+                           step_size=step_size)
+
+    return w, sup
+
+
+def l0_path(X, y, ks, tol=1e-4, max_iter=100, max_step=50, verbose=False, engine='auto', memory_budget=2 ** 28,
+            strict=False, callback=None, method='niht', step_size='normalized'):
+    """
+    Solves L0 penalized least-squares regression for a sequence of support sizes.
+    The engine (X.T @ y and, for the Gram engine, X.T @ X) is built once and every solve
+    is warm started from the solution for the previous support size, so ks are best given in increasing order
+    Parameters
+    ----------
+    X: n x m; design matrix
+    y: n x 1; vector of observations
+    ks: sequence of int; support sizes
+    tol, max_iter, max_step, verbose, engine, memory_budget, callback, method, step_size: see l0_reg.
+        The estimate of ||X||_2^2 for the Lipschitz step is made once for the whole path
+    strict: bool; whether to raise when IHT doesn't converge for some support size.
+        Otherwise the last iterate is kept and the path goes on
+    Returns W: m x len(ks); weights for each support size,
+            S: m x len(ks); supports for each support size,
+            losses: len(ks); final losses,
+            n_iters: len(ks); numbers of iterations, max_iter for the support sizes IHT didn't converge for
+    -------
+    """
+    engine = make_engine(X, y, engine, memory_budget)
+
+    m = X.shape[1]
+
+    W = np.zeros((m, len(ks)))
+    S = np.zeros((m, len(ks)), dtype=bool)
+    losses = np.zeros(len(ks))
+    n_iters = np.zeros(len(ks), dtype=int)
+
+    workspace = Workspace(engine)
+
+    w = None
+
+    for i, k in enumerate(ks):
+        w, sup, losses[i], n_iters[i] = run_iht(engine, k, w, tol, max_iter, max_step, verbose, strict, workspace,
+                                                callback, method, step_size)
+
+        W[:, i] = w.reshape(-1)
+        S[:, i] = sup
+
+    return W, S, losses, n_iters
+
+
+def l0_reg_multi(X, Y, k, tol=1e-4, max_iter=100, max_step=50, verbose=False, callback=None):
+    """
+    Solves T independent L0 penalized least-squares problems with a shared design matrix at once.
+    The products with X are done for all the targets together, the step size, backtracking
+    and convergence are tracked per target, and converged targets leave the active batch
+    Parameters
+    ----------
+    X: n x m; design matrix
+    Y: n x T; matrix of observations, one target per column
+    k: int; desired model (support) size
+    tol, max_iter, max_step, verbose, callback: see l0_reg, the records hold arrays over the active targets
+    Returns W: m x T; weights for each target,
+            S: m x T; supports for each target
+    -------
+    """
+    X = as_design_matrix(X)
+
+    callback = get_callback(callback, verbose, max_iter)
+
+    m, T = X.shape[1], Y.shape[1]
+
+    W = np.zeros((m, T))
+    S = np.zeros((m, T), dtype=bool)
+    XW = np.zeros_like(Y, dtype=W.dtype)
+
+    np.put_along_axis(S, get_topk(X.transpose() @ Y, k, return_value=False), True, axis=0)
+
+    active = np.arange(T)
+
+    for _iter in range(max_iter):
+
+        if _iter == max_iter - 1:
+            raise RuntimeError(f"IHT didn't converge for {len(active)} out of {T} targets! "
+                               f"Maybe you should increase the number of iterations or the tolerance")
+
+        timer = get_timer(callback)
+
+        W_prev, S_prev, XW_prev = W[:, active], S[:, active], XW[:, active]
+
+        G = X.transpose() @ (Y[:, active] - XW_prev)
+        G_sup = G * S_prev
+
+        if timer is not None:
+            timer.lap('gradient')
+
+        energy = ((X @ G_sup) ** 2).sum(axis=0)
+        mu = np.divide((G_sup ** 2).sum(axis=0), energy, out=np.zeros_like(energy), where=energy > 0)
+
+        if timer is not None:
+            timer.lap('step_size')
+
+        W_new, topk = get_topk(W_prev + mu * G, k)
+
+        S_new = np.zeros_like(S_prev)
+        np.put_along_axis(S_new, topk, True, axis=0)
+
+        if timer is not None:
+            timer.lap('threshold')
+
+        XW_new = X @ W_new
+
+        if timer is not None:
+            timer.lap('product')
+
+        # Backtracking with the same rule as in iht_step, for the targets whose support has changed
+        changed = (S_new != S_prev).any(axis=0)
+
+        omega_top = ((W_new - W_prev) ** 2).sum(axis=0)
+        omega_bot = ((XW_new - XW_prev) ** 2).sum(axis=0)
+
+        mu_step = np.zeros(len(active), dtype=int)
+        shrink = changed & (mu * omega_bot > 0.99 * omega_top) & (mu_step < max_step)
+
+        while shrink.any():
+            mu[shrink] /= 2
+            mu_step[shrink] += 1
+
+            shrink &= (mu * omega_bot > 0.99 * omega_top) & (mu_step < max_step)
+
+        if timer is not None:
+            timer.lap('backtracking')
+
+        backtracked = np.flatnonzero(mu_step)
+
+        if len(backtracked):
+            W_bt, topk = get_topk(W_prev[:, backtracked] + mu[backtracked] * G[:, backtracked], k)
+
+            W_new[:, backtracked] = W_bt
+            XW_new[:, backtracked] = X @ W_bt
+
+            S_bt = np.zeros_like(W_bt, dtype=bool)
+            np.put_along_axis(S_bt, topk, True, axis=0)
+
+            S_new[:, backtracked] = S_bt
+
+            if timer is not None:
+                timer.lap('backtracking')
+
+        loss = ((Y[:, active] - XW_new) ** 2).sum(axis=0) / 2
+
+        if not np.isfinite(loss).all():
+            raise RuntimeError("The loss is not finite")
+
+        norm = abs(W_new - W_prev).max(axis=0)
+        scaled_norm = norm / (abs(W_prev).max(axis=0) + 1)
+
+        W[:, active], S[:, active], XW[:, active] = W_new, S_new, XW_new
+
+        if callback is not None:
+            timer.lap('loss')
+
+            callback(dict(iteration=_iter, k=k, active=len(active), loss=loss, mu=mu, mu_step=mu_step,
+                          support_changes=(S_new & ~S_prev).sum(axis=0), norm=norm, scaled_norm=scaled_norm,
+                          converged=scaled_norm < tol, timings=timer.timings))
+
+        active = active[scaled_norm >= tol]
+
+        if len(active) == 0:
+            if verbose:
+                print(f"IHT has converged for all {T} targets in {_iter} iterations")
+
+            return W, S
+
+
+def run_iht(engine, k, w_init=None, tol=1e-4, max_iter=100, max_step=50, verbose=False, strict=True,
+            workspace=None, callback=None, method='niht', step_size='normalized'):
+    """
+    Iterative hard thresholding loop over a prepared engine.
+    The iterate is kept compact: k sorted feature indices and the weights on them
+    Parameters
+    ----------
+    engine: DirectEngine or GramEngine; see make_engine
+    k: int; desired model (support) size
+    w_init: m x 1; vector of weights to warm start from, zeros by default
+    tol, max_iter, max_step, verbose, callback, method, step_size: see l0_reg
+    strict: bool; whether to raise if IHT doesn't converge in max_iter iterations or to return the last iterate
+    workspace: Workspace; buffers to reuse, a new one is allocated by default
+    Returns w: m x 1; vector of weights,
+            sup: m; support set,
+            loss: float; final loss,
+            n_iter: int; number of iterations, max_iter if IHT didn't converge
+    -------
     """
-    w_prev = np.zeros((X.shape[1], 1))
-    Xw_prev = np.zeros_like(y)
+    if workspace is None:
+        workspace = Workspace(engine)
+
+    callback = get_callback(callback, verbose, max_iter)
+
+    step = get_step(method, step_size)
+
+    if w_init is None or not np.any(w_init):
+        idx_prev = get_topk_idx(engine.Xty, k, workspace)
+
+    else:
+        nonzero = get_topk_idx(w_init, min(k, np.count_nonzero(w_init)), workspace)
 
-    topk = get_topk(X.transpose() @ y, k, return_value=False)
-    sup_prev = get_support(w_prev, topk)
+        # Keep the warm start support and fill it up with the largest gradient entries
+        score = abs(engine.gradient(engine.product(nonzero, w_init[nonzero])))
+        score[nonzero] = np.inf
 
-    dy_prev = y - Xw_prev
+        idx_prev = get_topk_idx(score, k, workspace)
+
+    w_prev = np.zeros((k, 1)) if w_init is None else w_init[idx_prev]
+    Xw_prev = engine.product(idx_prev, w_prev, out=workspace.Xw_prev)
+
+    loss = engine.loss(idx_prev, w_prev, Xw_prev)
 
     for _iter in range(max_iter):
 
         if _iter == max_iter - 1:
-            raise RuntimeError("IHT didn't converge! Maybe you should increase the number of iterations or the tolerance")
+            if strict:
+                raise RuntimeError("IHT didn't converge! Maybe you should increase the number of iterations or the tolerance")
+
+            if verbose:
+                print(f"IHT didn't converge in {max_iter} iterations for support size {k}")
 
-        w, sup, Xw, mu, mu_step = iht_step(X, w_prev, sup_prev, Xw_prev, dy_prev, k, _iter, max_step)
+            w, sup = to_dense(engine, idx_prev, w_prev)
 
-        dy = y - Xw
+            return w, sup, loss, max_iter
 
-        loss = (dy ** 2).sum() / 2
+        timer = get_timer(callback)
+
+        idx, w, Xw, mu, mu_step = step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace, timer)
+
+        loss = engine.loss(idx, w, Xw)
 
         if not np.isfinite(loss):
             raise RuntimeError("The loss is not finite")
 
-        norm = np.linalg.norm((w - w_prev).reshape(-1), ord=np.inf)
-        scaled_norm = norm / (np.linalg.norm(w_prev.reshape(-1), ord=np.inf) + 1)
+        norm = abs(get_difference(idx, w, idx_prev, w_prev)).max()
+        scaled_norm = norm / (abs(w_prev).max() + 1)
 
         converged = scaled_norm < tol
 
-        if verbose:
-            if _iter % (max_iter // 10) == 0:
-                print(f"Iteration {_iter}, loss {loss:.4f}, weights norm {norm:.4f}, scaled norm {scaled_norm:.4f}")
-                print(f"Gradient step size mu is {mu:.5f}")
-                if mu_step != 0:
-                    print(f"Backtracking finished in {mu_step} steps")
+        if callback is not None:
+            timer.lap('loss')
+
+            callback(dict(iteration=_iter, k=k, loss=loss, mu=mu, mu_step=mu_step,
+                          support_changes=k - len(np.intersect1d(idx, idx_prev, assume_unique=True)),
+                          norm=norm, scaled_norm=scaled_norm, converged=converged, timings=timer.timings))
 
         if converged:
-            print(f"IHT has converged in {_iter} iterations with loss {loss:.4f}, weights norm {norm:.4f}")
+            if verbose:
+                print(f"IHT has converged in {_iter} iterations with loss {loss:.4f}, weights norm {norm:.4f}")
 
-            return w, sup
+            w, sup = to_dense(engine, idx, w)
 
+            return w, sup, loss, _iter + 1
+
+        idx_prev = idx
         w_prev = w
-        sup_prev = sup
-        Xw_prev = Xw
-        dy_prev = dy
+        Xw_prev = workspace.swap()
 
 
-def iht_step(X, w_prev, sup_prev, Xw_prev, dy_prev, k, _iter, max_step):
+def iht_step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace=None, timer=None, mu=None):
     """
     A single step of iterative hard thresholding
 
     Parameters
     ----------
-    X: n x m; design matrix
-    y: n x 1; vector of observations
-    w_prev: m x 1; vector of weights
-    sup_prev: m; support set
-    Xw_prev: n x 1; vector of the result of X @ w_prev
-    dy_prev: n x 1; vector of the result of y - X @ w_prev
+    engine: DirectEngine or GramEngine; provides the products with the design matrix
+    idx_prev: k; sorted indices of the support set
+    w_prev: k x 1; vector of weights on the support set
+    Xw_prev: engine.product(idx_prev, w_prev); X @ w for the direct engine, X.T @ X @ w for the Gram one
     k: int; desired model (support) size
     _iter: int; current iteration index
     max_step: int; maximum number of backtracking steps for the step size calculation
+    workspace: Workspace; buffers to reuse, the returned product is written to workspace.Xw
+    timer: PhaseTimer; times the phases of the step if given, see fes.methods.telemetry
+    mu: float; step size to start the backtracking from instead of the normalized one, see LipschitzStep
     """
-    g = X.transpose() @ dy_prev
+    if workspace is None:
+        workspace = Workspace(engine)
+
+    g = engine.gradient(Xw_prev, out=workspace.g)
+
+    if timer is not None:
+        timer.lap('gradient')
+
+    if mu is None:
+        g_sup = g[idx_prev]
+        energy = engine.energy(idx_prev, g_sup)
 
-    g_sup = g[sup_prev]
-    X_sup = X[:, sup_prev]
+        # The gradient vanishes on the support when the previous iterate is already optimal there
+        mu = (g_sup ** 2).sum() / energy if energy > 0 else 0.
 
-    gX_sup = X_sup @ g_sup
-    mu = (g_sup ** 2).sum() / (gX_sup ** 2).sum()
+        if timer is not None:
+            timer.lap('step_size')
 
-    w, topk = get_topk(w_prev + mu * g, k)
-    sup = get_support(w, topk)
+    idx, w = threshold(idx_prev, w_prev, mu, g, k, workspace)
 
-    Xw = X @ w
+    if timer is not None:
+        timer.lap('threshold')
+
+    Xw = engine.product(idx, w, out=workspace.Xw)
+
+    if timer is not None:
+        timer.lap('product')
 
     mu_step = 0
 
-    if (sup != sup_prev).any():
-        omega_top = ((w - w_prev) ** 2).sum()
-        omega_bot = ((Xw - Xw_prev) ** 2).sum()
+    if not np.array_equal(idx, idx_prev):
+        omega_top = (get_difference(idx, w, idx_prev, w_prev) ** 2).sum()
+        omega_bot = engine.distance(idx, w, Xw, idx_prev, w_prev, Xw_prev)
 
+        # The bound doesn't depend on the thresholded weights, so they are recomputed only once for the final mu
         while mu * omega_bot > 0.99 * omega_top and \
                 mu_step < max_step:
             mu /= 2
 
-            w, topk = get_topk(w_prev + mu * g, k)
-
             mu_step += 1
 
-        Xw = X @ w
-        sup = get_support(w, topk)
+        if timer is not None:
+            timer.lap('backtracking')
+
+        if mu_step != 0:
+            idx, w = threshold(idx_prev, w_prev, mu, g, k, workspace)
+
+            if timer is not None:
+                timer.lap('threshold')
+
+            Xw = engine.product(idx, w, out=workspace.Xw)
+
+            if timer is not None:
+                timer.lap('product')
+
+    return idx, w, Xw, mu, mu_step
+
+
+def threshold(idx_prev, w_prev, mu, g, k, workspace=None):
+    """
+    Hard thresholding of the gradient step w_prev + mu * g
+
+    Parameters
+    ----------
+    idx_prev: k; sorted indices of the support set
+    w_prev: k x 1; vector of weights on the support set
+    mu: float; step size
+    g: m x 1; gradient
+    k: int; desired model (support) size
+    workspace: Workspace; buffers to reuse
+    Returns idx: k; sorted indices of the new support set,
+            w: k x 1; new weights on it
+    -------
+    """
+    v = np.multiply(g, mu, out=None if workspace is None else workspace.v)
+    v[idx_prev] += w_prev
+
+    idx = get_topk_idx(v, k, workspace)
+
+    return idx, v[idx]
+
+
+def get_step(method='niht', step_size='normalized'):
+    """
+    Returns the step function of the method, with the signature of iht_step. The accelerated steps keep state
+    across iterations, so a new one is made for every solve
+    """
+    if step_size == 'lipschitz':
+        if method != 'niht':
+            raise ValueError(f"The Lipschitz step size is only supported by normalized IHT, not {method}")
+
+        return LipschitzStep()
+
+    elif step_size != 'normalized':
+        raise ValueError(f"Unknown step size: {step_size}")
+
+    if method == 'niht':
+        return iht_step
+
+    elif method == 'aiht':
+        return AIHTStep()
+
+    elif method == 'cgiht':
+        return CGIHTStep()
+
+    elif method == 'htp':
+        return HTPStep()
+
+    else:
+        raise ValueError(f"Unknown IHT method: {method}")
+
+
+class LipschitzStep:
+    """
+    Normalized IHT step that takes the safe step 0.9 / L, L = ||X||_2^2, while the support changes.
+    A step of at most 0.99 / L meets the backtracking rule of iht_step for any new support, the rest is the margin
+    for the underestimate of L, so these steps threshold and multiply once and skip the product X @ g
+    of the normalized step size, whereas a normalized step that overshoots is thresholded and multiplied twice.
+    Once the support stays the same the normalized step, which only depends on the support columns, is taken
+    until the support changes again. L bounds the curvature over all the columns, so the safe step
+    is the smaller the more correlated X is and the solve may take more iterations. L is estimated once
+    per design matrix by get_lipschitz, the backtracking of iht_step still guards the steps against an underestimate
+    """
+
+    def __init__(self):
+        self.stable = False
+
+    def __call__(self, engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace=None, timer=None):
+        mu = None if self.stable else 0.9 / get_lipschitz(engine)
+
+        if timer is not None and mu is not None:
+            timer.lap('step_size')
+
+        idx, w, Xw, mu, mu_step = iht_step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace, timer,
+                                           mu)
+
+        self.stable = np.array_equal(idx, idx_prev)
+
+        return idx, w, Xw, mu, mu_step
+
+
+def get_lipschitz(engine, tol=1e-2, seed=0):
+    """
+    Returns the estimate of L = ||X||_2^2, the largest eigenvalue of X.T @ X and the Lipschitz constant of
+    the gradient. It is computed by Lanczos iterations (ARPACK) from a random vector, every iteration costs
+    a product with X and X.T and about twenty of them reach tol even when the top eigenvalues of X.T @ X are
+    clustered, as for Gaussian X, where power iterations converge slowly. The estimate is a Ritz value and thus
+    a lower bound of L. ARPACK stops at the relative residual tol, which left it within 2% of L on Gaussian X,
+    so the safe step of LipschitzStep stays below 0.99 / L. Small X.T @ X are factorized instead.
+    The estimate is cached by design matrix, so a path, repeated solves and other engines on the same X make it
+    once. X modified in place keeps its estimate
+
+    Parameters
+    ----------
+    engine: DirectEngine or GramEngine
+    tol: float; relative accuracy of the estimate
+    seed: int; seed of the start vector
+    """
+    L = lipschitz_cache.get(engine.source)
+
+    if L is not None:
+        return L
+
+    if engine.m <= 20:
+        L = np.linalg.eigvalsh(engine.hessian_product(np.eye(engine.m)))[-1]
+
+    else:
+        H = scipy.sparse.linalg.LinearOperator((engine.m, engine.m), dtype=np.float64,
+                                               matvec=lambda v: engine.hessian_product(v.reshape(-1, 1)))
+
+        v0 = np.random.default_rng(seed).standard_normal(engine.m)
+
+        L = scipy.sparse.linalg.eigsh(H, k=1, which='LA', tol=tol, v0=v0, return_eigenvectors=False)[0]
+
+    lipschitz_cache.set(engine.source, L)
+
+    return L
+
+
+class LipschitzCache:
+    """
+    Estimates of L = ||X||_2^2 by design matrix. Numpy arrays aren't hashable, so the estimates are kept by id(X)
+    and dropped once X is garbage collected, before its id can be reused. Design matrices that don't support
+    weak references aren't cached
+    """
+
+    def __init__(self):
+        self.estimates = {}
+
+    def get(self, X):
+        return self.estimates.get(id(X))
+
+    def set(self, X, L):
+        key = id(X)
+
+        if key not in self.estimates:
+            try:
+                weakref.finalize(X, self.estimates.pop, key, None)
+
+            except TypeError:
+                return
+
+        self.estimates[key] = L
+
+
+lipschitz_cache = LipschitzCache()
+
+
+class AIHTStep:
+    """
+    Accelerated IHT step: the normalized IHT step is taken from the extrapolation
+    z = w + beta (w - w_last) of the last two iterates, with the Nesterov sequence of beta.
+    X @ z is the same combination of the products already known, so the momentum costs no extra product.
+    Whenever the step increases the loss the momentum is reset and a normalized IHT step is taken instead
+    """
+
+    def __init__(self):
+        self.t = 1.
+        self.idx_last = None
+        self.w_last = None
+        self.Xw_last = None
+
+    def __call__(self, engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace=None, timer=None):
+        if workspace is None:
+            workspace = Workspace(engine)
+
+        t_next = (1 + np.sqrt(1 + 4 * self.t ** 2)) / 2
+        beta = (self.t - 1) / t_next
+
+        if self.idx_last is None or beta == 0:
+            idx_z, z, Xz = idx_prev, w_prev, Xw_prev
+
+        else:
+            idx_z = np.union1d(idx_prev, self.idx_last)
+
+            z = (1 + beta) * scatter(np.searchsorted(idx_z, idx_prev), w_prev, len(idx_z))
+            z -= beta * scatter(np.searchsorted(idx_z, self.idx_last), self.w_last, len(idx_z))
+
+            Xz = (1 + beta) * Xw_prev - beta * self.Xw_last
+
+        g = engine.gradient(Xz, out=workspace.g)
+        g_sup = g[idx_prev]
+
+        if timer is not None:
+            timer.lap('gradient')
+
+        energy = engine.energy(idx_prev, g_sup)
+        mu = (g_sup ** 2).sum() / energy if energy > 0 else 0.
+
+        if timer is not None:
+            timer.lap('step_size')
+
+        idx, w = threshold(idx_z, z, mu, g, k, workspace)
+
+        if timer is not None:
+            timer.lap('threshold')
+
+        Xw = engine.product(idx, w, out=workspace.Xw)
+
+        if timer is not None:
+            timer.lap('product')
+
+        mu_step = 0
+
+        if engine.loss(idx, w, Xw) > engine.loss(idx_prev, w_prev, Xw_prev):
+            t_next = 1.
+
+            idx, w, Xw, mu, mu_step = iht_step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace,
+                                               timer)
+
+        self.t = t_next
+        self.idx_last, self.w_last = idx_prev, w_prev.copy()
+
+        if self.Xw_last is None:
+            self.Xw_last = Xw_prev.copy()
+        else:
+            # Xw_prev is a workspace buffer that the next step overwrites
+            np.copyto(self.Xw_last, Xw_prev)
+
+        return idx, w, Xw, mu, mu_step
+
+
+class CGIHTStep:
+    """
+    Restarted conjugate gradient IHT step (after Blanchard, Tanner and Wei): the support is updated by
+    a normalized IHT step, and while it stays the same the weights take conjugate gradient steps on it
+    instead of steepest descent ones, which solve the least squares on a fixed support in at most k steps.
+    The direction is restarted from the gradient whenever the support changes. X @ w is updated
+    from the product with the direction, so a conjugate gradient step costs one product more than IHT
+    """
+
+    def __init__(self):
+        self.idx_last = None
+        self.p = None
+        self.Xp = None
+
+    def __call__(self, engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace=None, timer=None):
+        if workspace is None:
+            workspace = Workspace(engine)
+
+        idx, w, Xw, mu, mu_step = iht_step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace, timer)
+
+        if not np.array_equal(idx, idx_prev):
+            self.p = None
+
+            return idx, w, Xw, mu, mu_step
+
+        # iht_step leaves the gradient at w_prev in the workspace
+        g_sup = workspace.g[idx_prev]
+
+        if self.p is not None and np.array_equal(idx_prev, self.idx_last):
+            # Conjugacy on the support: <X (g + beta p), X p> = 0
+            beta = -engine.inner(idx_prev, g_sup, self.Xp) / engine.inner(idx_prev, self.p, self.Xp)
+
+            p = g_sup + beta * self.p
+
+        else:
+            p = g_sup.copy()
+
+        Xp = engine.product(idx_prev, p)
+        energy = engine.inner(idx_prev, p, Xp)
 
-    return w, sup, Xw, mu, mu_step
+        mu = (g_sup * p).sum() / energy if energy > 0 else 0.
+
+        w = w_prev + mu * p
+        Xw = np.add(Xw_prev, mu * Xp, out=workspace.Xw)
+
+        if timer is not None:
+            timer.lap('conjugate_gradient')
+
+        self.idx_last, self.p, self.Xp = idx_prev, p, Xp
+
+        return idx_prev, w, Xw, mu, mu_step
+
+
+class HTPStep:
+    """
+    Hard thresholding pursuit step (Foucart): the support is selected by a normalized IHT step,
+    and the weights are the least squares solution on it. Once the support is the same on two steps,
+    so are the weights and the solve has converged. A normalized IHT step is taken instead whenever
+    the step increases the loss
+    """
+
+    def __call__(self, engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace=None, timer=None):
+        if workspace is None:
+            workspace = Workspace(engine)
+
+        g = engine.gradient(Xw_prev, out=workspace.g)
+
+        if timer is not None:
+            timer.lap('gradient')
+
+        # The gradient vanishes on the support of a least squares iterate, so the step is normalized
+        # on the largest gradient entries instead, the ones that may enter the support
+        idx_g = get_topk_idx(g, k, workspace)
+        g_sup = g[idx_g]
+
+        energy = engine.energy(idx_g, g_sup)
+        mu = (g_sup ** 2).sum() / energy if energy > 0 else 0.
+
+        if timer is not None:
+            timer.lap('step_size')
+
+        idx, _ = threshold(idx_prev, w_prev, mu, g, k, workspace)
+
+        if timer is not None:
+            timer.lap('threshold')
+
+        w = engine.solve(idx)
+
+        if timer is not None:
+            timer.lap('solve')
+
+        Xw = engine.product(idx, w, out=workspace.Xw)
+
+        if timer is not None:
+            timer.lap('product')
+
+        mu_step = 0
+
+        if engine.loss(idx, w, Xw) > engine.loss(idx_prev, w_prev, Xw_prev):
+            idx, w, Xw, mu, mu_step = iht_step(engine, idx_prev, w_prev, Xw_prev, k, _iter, max_step, workspace,
+                                               timer)
+
+        return idx, w, Xw, mu, mu_step
+
+
+class Workspace:
+    """
+    Buffers reused by run_iht and iht_step across iterations, so that for dense X
+    the steady state iterations don't allocate anything but a few vectors of size k.
+    A workspace doesn't depend on the support size and can be shared along a path
+    """
+
+    def __init__(self, engine):
+        m = engine.m
+
+        self.g = np.empty((m, 1))
+        self.v = np.empty((m, 1))
+        self.abs_v = np.empty((m, 1))
+        self.mask = np.empty((m, 1), dtype=bool)
+
+        self.Xw = np.empty(engine.product_shape)
+        self.Xw_prev = np.empty(engine.product_shape)
+
+    def swap(self):
+        """
+        Makes the last product the previous one and returns it
+        """
+        self.Xw, self.Xw_prev = self.Xw_prev, self.Xw
+
+        return self.Xw_prev
+
+
+"""
+Engines
+"""
+
+
+def make_engine(X, y, engine='auto', memory_budget=2 ** 28):
+    """
+    Parameters
+    ----------
+    X: n x m; design matrix
+    y: n x 1; vector of observations
+    engine: str or engine; 'direct' works with X on every iteration, 'gram' precomputes X.T @ X and X.T @ y once
+        and iterates in the m-dimensional space. 'auto' picks 'gram' for tall problems (n > m)
+        whose Gram matrix fits into memory_budget
+    memory_budget: int; maximum number of bytes the Gram matrix is allowed to take when engine is 'auto'
+    """
+    if not isinstance(engine, str):
+        return engine
+
+    if engine == 'auto':
+        n, m = X.shape
+        engine = 'gram' if n > m and m * m * np.dtype(np.float64).itemsize <= memory_budget else 'direct'
+
+    if sp.issparse(y):
+        y = y.toarray()
+
+    if engine == 'direct':
+        return DirectEngine(X, y)
+
+    elif engine == 'gram':
+        return GramEngine(X, y)
+
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+class DirectEngine:
+    """
+    Computes the products with X explicitly. The gradient costs O(n * m) (O(nnz) for sparse X),
+    the products with the weights cost O(n * k) since only the support columns are touched.
+    Besides numpy arrays and scipy.sparse matrices X can be any operator that supports X @ w, X.T @ r
+    and X[:, idx], e.g. fes.methods.streaming.ChunkedDesign. Operators that implement
+    support_product(idx, w) get it called for X[:, idx] @ w instead of gathering the columns
+    """
+
+    def __init__(self, X, y):
+        self.X = as_design_matrix(X)
+        self.source = X
+        self.y = y
+        self.Xty = X.transpose() @ y
+
+        self.m = X.shape[1]
+        self.product_shape = y.shape
+
+        self.residual = np.empty(y.shape)
+        self.scratch = np.empty(y.shape)
+
+        self.columns = ColumnCache(self.X) if isinstance(self.X, np.ndarray) else None
+        self.factor = CholeskyCache(self.gram, self.Xty)
+
+    def product(self, idx, w, out=None):
+        """
+        Returns X[:, idx] @ w
+        """
+        if self.columns is not None:
+            return self.columns.product(idx, w, out)
+
+        if hasattr(self.X, 'support_product'):
+            return to_out(self.X.support_product(idx, w), out)
+
+        if sp.issparse(self.X) and self.X.format == 'csr':
+            # Gathering columns of a row major matrix copies most of it, a scattered product doesn't copy at all
+            return to_out(self.X @ scatter(idx, w, self.m), out)
+
+        return to_out(self.X[:, idx] @ w, out)
+
+    def gradient(self, Xw, out=None):
+        np.subtract(self.y, Xw, out=self.residual)
+
+        if isinstance(self.X, np.ndarray):
+            return np.matmul(self.X.transpose(), self.residual, out=out)
+
+        return to_out(self.X.transpose() @ self.residual, out)
+
+    def energy(self, idx, v):
+        """
+        Returns ||X[:, idx] @ v||^2
+        """
+        Xv = self.product(idx, v, out=self.scratch)
+
+        return np.vdot(Xv, Xv)
+
+    def inner(self, idx, v, Xu):
+        """
+        Returns <X[:, idx] @ v, X @ u> for the product Xu = X @ u
+        """
+        Xv = self.product(idx, v, out=self.scratch)
+
+        return np.vdot(Xv, Xu)
+
+    def hessian_product(self, v):
+        """
+        Returns X.T @ X @ v
+        """
+        return np.asarray(self.X.transpose() @ (self.X @ v))
+
+    def gram(self, rows, cols):
+        """
+        Returns X[:, rows].T @ X[:, cols]
+        """
+        G = as_float(self.X[:, rows]).transpose() @ as_float(self.X[:, cols])
+
+        return G.toarray() if sp.issparse(G) else np.asarray(G)
+
+    def solve(self, idx):
+        """
+        Returns the least squares weights on the support idx, from the normal equations with the Cholesky factor
+        updated from the previous support, or with a QR based solve if the support columns are linearly dependent
+        """
+        try:
+            return self.factor.solve(idx)
+
+        except np.linalg.LinAlgError:
+            pass
+
+        if self.columns is not None:
+            # The support columns are gathered in the slots of the cache, not in the order of idx
+            self.columns.gather(idx)
+
+            w = np.linalg.lstsq(self.columns.cols, self.y, rcond=None)[0]
+
+            return w[np.argsort(self.columns.idx)]
+
+        X_sup = self.X[:, idx]
+
+        if sp.issparse(X_sup):
+            X_sup = X_sup.toarray()
+
+        return np.linalg.lstsq(X_sup, self.y, rcond=None)[0]
+
+    def distance(self, idx, w, Xw, idx_prev, w_prev, Xw_prev):
+        """
+        Returns ||X @ (w - w_prev)||^2
+        """
+        dXw = np.subtract(Xw, Xw_prev, out=self.scratch)
+
+        return np.vdot(dXw, dXw)
+
+    def loss(self, idx, w, Xw):
+        dy = np.subtract(self.y, Xw, out=self.residual)
+
+        return np.vdot(dy, dy) / 2
+
+
+class GramEngine:
+    """
+    Precomputes G = X.T @ X and X.T @ y once (O(n * m^2)), after that every iteration
+    costs O(m * k) since only the support columns of G are touched
+    """
+
+    def __init__(self, X, y):
+        X_float = as_float(X)
+
+        self.source = X
+        self.G = X_float.transpose() @ X_float
+
+        if sp.issparse(self.G):
+            self.G = self.G.toarray()
+
+        self.Xty = X.transpose() @ y
+        self.yty = (y ** 2).sum()
+
+        self.m = X.shape[1]
+        self.product_shape = self.Xty.shape
+
+        self.scratch = np.empty(self.Xty.shape)
+
+        self.columns = ColumnCache(self.G)
+        self.factor = CholeskyCache(self.gram, self.Xty)
+
+    def product(self, idx, w, out=None):
+        return self.columns.product(idx, w, out)
+
+    def gradient(self, Gw, out=None):
+        return np.subtract(self.Xty, Gw, out=out)
+
+    def energy(self, idx, v):
+        return (v * (self.G[np.ix_(idx, idx)] @ v)).sum()
+
+    def inner(self, idx, v, Gu):
+        return (v * Gu[idx]).sum()
+
+    def hessian_product(self, v):
+        return self.G @ v
+
+    def gram(self, rows, cols):
+        return self.G[np.ix_(rows, cols)]
+
+    def solve(self, idx):
+        try:
+            return self.factor.solve(idx)
+
+        except np.linalg.LinAlgError:
+            # The support columns are linearly dependent
+            return np.linalg.lstsq(self.gram(idx, idx), self.Xty[idx], rcond=None)[0]
+
+    def distance(self, idx, w, Gw, idx_prev, w_prev, Gw_prev):
+        dGw = np.subtract(Gw, Gw_prev, out=self.scratch)
+
+        return (w * dGw[idx]).sum() - (w_prev * dGw[idx_prev]).sum()
+
+    def loss(self, idx, w, Gw):
+        return (self.yty - 2 * (self.Xty[idx] * w).sum() + (w * Gw[idx]).sum()) / 2
+
+
+class ColumnCache:
+    """
+    Keeps the support columns of a dense matrix A gathered. When the support changes
+    only the columns that enter it are copied into the slots of the ones that leave it
+    """
+
+    def __init__(self, A):
+        self.A = A
+
+        self.idx = None
+        self.cols = None
+
+    def product(self, idx, w, out=None):
+        """
+        Returns A[:, idx] @ w for sorted idx
+        """
+        self.gather(idx)
+
+        return np.matmul(self.cols, w[np.searchsorted(idx, self.idx)], out=out)
+
+    def gather(self, idx):
+        if self.idx is None or len(self.idx) != len(idx):
+            self.idx = idx.copy()
+            self.cols = np.asfortranarray(self.A[:, idx])
+
+            return
+
+        leaving = np.flatnonzero(~np.isin(self.idx, idx, assume_unique=True))
+
+        if len(leaving):
+            entering = np.setdiff1d(idx, self.idx, assume_unique=True)
+
+            # Column by column, so that the entering columns are copied straight into their slots
+            for slot, j in zip(leaving, entering):
+                self.cols[:, slot] = self.A[:, j]
+
+            self.idx[leaving] = entering
+
+
+class CholeskyCache:
+    """
+    Keeps the upper triangular Cholesky factor R of the Gram matrix of the support columns,
+    X[:, idx].T @ X[:, idx] = R.T @ R, with the features in the order they entered the support.
+    When the support changes the features that leave it are deleted from R with Givens rotations and the ones
+    that enter it are appended, O(k^2) each once their Gram entries are known, instead of factorizing
+    from scratch in O(k^3). The factor is rebuilt when most of the support changes, and after k updates
+    so that the rounding errors of the updates don't build up
+
+    Parameters
+    ----------
+    gram: function; gram(rows, cols) returns X[:, rows].T @ X[:, cols]
+    Xty: m x 1; X.T @ y, the right hand side of the normal equations
+    """
+
+    def __init__(self, gram, Xty):
+        self.gram = gram
+        self.Xty = Xty
+
+        self.idx = None
+        self.R = None
+        self.updates = 0
+
+    def solve(self, idx):
+        """
+        Returns the least squares weights on the sorted support idx. Raises np.linalg.LinAlgError
+        if the support columns are linearly dependent
+        """
+        self.update(idx)
+
+        z = scipy.linalg.solve_triangular(self.R, self.Xty[self.idx], trans='T', check_finite=False)
+        w = scipy.linalg.solve_triangular(self.R, z, check_finite=False)
+
+        return w[np.argsort(self.idx)]
+
+    def update(self, idx):
+        leaving = np.flatnonzero(~np.isin(self.idx, idx, assume_unique=True)) if self.idx is not None else None
+
+        if self.idx is None or 2 * len(leaving) > len(idx) or self.updates >= len(idx):
+            self.factorize(idx)
+
+            return
+
+        entering = np.setdiff1d(idx, self.idx, assume_unique=True)
+
+        # The slots are deleted from the last one, so the earlier ones keep their positions
+        for slot in leaving[::-1]:
+            self.R = delete_column(self.R, slot)
+
+        self.idx = np.delete(self.idx, leaving)
+
+        if len(entering):
+            order = np.concatenate([self.idx, entering])
+            C = self.gram(order, entering)
+
+            for i, j in enumerate(entering):
+                self.insert(C[:len(self.idx), i], C[len(self.idx), i])
+
+                self.idx = order[:len(self.idx) + 1]
+
+        self.updates += len(leaving) + len(entering)
+
+    def factorize(self, idx):
+        # Until the factorization succeeds the cache is empty, so a failed one is retried from scratch
+        self.idx = None
+
+        self.R = scipy.linalg.cholesky(self.gram(idx, idx))
+
+        self.idx = idx.copy()
+        self.updates = 0
+
+    def insert(self, c, d):
+        """
+        Appends the column with Gram entries c with the support columns and d with itself
+        """
+        r = scipy.linalg.solve_triangular(self.R, c, trans='T', check_finite=False)
+        rho2 = d - np.dot(r, r)
+
+        if not rho2 > 1e-10 * d:
+            self.idx = None
+
+            raise np.linalg.LinAlgError("The column is linearly dependent on the support columns")
+
+        k = len(r)
+
+        R = np.zeros((k + 1, k + 1))
+        R[:k, :k] = self.R
+        R[:k, k] = r
+        R[k, k] = np.sqrt(rho2)
+
+        self.R = R
+
+
+def delete_column(R, i):
+    """
+    Returns the Cholesky factor of the Gram matrix without its i-th row and column: the i-th column of R
+    is removed and the part below the diagonal it leaves in the trailing rows is rotated away with
+    Givens rotations in O(k^2). qr_delete runs the rotations in compiled code, the identity stands
+    for the orthogonal factor the Cholesky factor doesn't need
+    """
+    k = len(R)
+
+    R_new = np.zeros((k - 1, k - 1))
+    R_new[:i, :i] = R[:i, :i]
+    R_new[:i, i:] = R[:i, i + 1:]
+
+    _, trailing = scipy.linalg.qr_delete(np.eye(k - i), R[i:, i:], 0, which='col', check_finite=False)
+
+    R_new[i:, i:] = trailing[:-1]
+
+    return R_new
 
 
 """
@@ -117,19 +1105,42 @@ Support utils
 """
 
 
+def as_design_matrix(X):
+    """
+    Sparse design matrices are brought to CSR or CSC, the formats that support fast products
+    and column gathers. Dense ones are returned as is
+    """
+    if sp.issparse(X) and X.format not in ('csr', 'csc'):
+        return X.tocsr()
+
+    return X
+
+
+def as_float(A):
+    """
+    Returns dense or sparse A in float64, in which the Gram products are computed: the products of integer
+    and boolean matrices in their own dtype overflow. Float64 matrices and operators are returned as is,
+    the operators compute their Gram products in float64 themselves
+    """
+    if isinstance(A, np.ndarray) or sp.issparse(A):
+        return A.astype(np.float64, copy=False)
+
+    return A
+
+
 def get_topk(v, k, return_value=True):
     """
     Parameters
     ----------
-    v: m x 1 vector
+    v: m x 1 vector or m x T matrix, in which case the top k entries of every column are taken
     k: int
     return_value: bool
     """
-    topk = np.argpartition(abs(v), k, axis=0)[-k:]
+    topk = np.argpartition(abs(v), -k, axis=0)[-k:]
 
     if return_value:
         sup_v = np.zeros_like(v)
-        sup_v[topk] = v[topk]
+        np.put_along_axis(sup_v, topk, np.take_along_axis(v, topk, axis=0), axis=0)
 
         return sup_v, topk
 
@@ -137,8 +1148,75 @@ def get_topk(v, k, return_value=True):
         return topk
 
 
-def get_support(v, top_k):
-    sup = np.zeros((v.shape[0]), dtype=np.bool)
-    sup[top_k] = True
+def get_topk_idx(v, k, workspace=None):
+    """
+    Returns sorted indices of the top k entries of m x 1 vector v.
+    With a workspace the magnitudes are partitioned in place instead of allocating an index array of size m
+    """
+    if workspace is None:
+        return np.sort(get_topk(v, k, return_value=False).reshape(-1))
+
+    m = v.shape[0]
+
+    abs_v = np.abs(v, out=workspace.abs_v)
+    abs_v.partition(m - k, axis=0)
+    kth = abs_v[m - k, 0]
+
+    abs_v = np.abs(v, out=workspace.abs_v)
+    idx = np.flatnonzero(np.greater_equal(abs_v, kth, out=workspace.mask))
+
+    if len(idx) > k:
+        # There are ties at the k-th magnitude, the first of them are kept
+        above = np.flatnonzero(np.greater(abs_v, kth, out=workspace.mask))
+        ties = np.setdiff1d(idx, above, assume_unique=True)
+
+        idx = np.union1d(above, ties[:k - len(above)])
+
+    return idx
+
+
+def get_difference(idx, w, idx_prev, w_prev):
+    """
+    Returns the nonzero entries of w - w_prev, both given on their sorted supports idx and idx_prev
+    """
+    _, common, common_prev = np.intersect1d(idx, idx_prev, assume_unique=True, return_indices=True)
+
+    diff = w.copy()
+    diff[common] -= w_prev[common_prev]
+
+    leaving = np.ones(len(idx_prev), dtype=bool)
+    leaving[common_prev] = False
+
+    return np.concatenate([diff, -w_prev[leaving]])
+
+
+def scatter(idx, w, m):
+    """
+    Returns the m x 1 vector with values w at indices idx
+    """
+    v = np.zeros((m,) + w.shape[1:], dtype=w.dtype)
+    v[idx] = w
+
+    return v
+
+
+def to_out(v, out):
+    """
+    Copies v to out if the latter is given. Used for the products that don't support out parameter
+    """
+    if out is None:
+        return v
+
+    out[...] = v
+
+    return out
+
+
+def to_dense(engine, idx, w):
+    """
+    Returns m x 1 vector of weights and m support set of the compact iterate
+    """
+    sup = np.zeros(engine.m, dtype=bool)
+    sup[idx] = True
 
-    return sup
+    return scatter(idx, w, engine.m), sup
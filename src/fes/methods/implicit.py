@@ -0,0 +1,231 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.signal import lfilter
+
+from fes.methods.design import RowBlockDesign
+
+"""
+Gaussian design matrices defined by a seed. Every block of BLOCK_ROWS rows has its own random stream,
+spawned from the seed by the block index, so the blocks can be generated independently and in any order.
+A stream draws the noise of its rows first and then the rows one after another, so a block is processed
+in chunks of rows that fit into the memory budget and the data doesn't depend on the chunks
+"""
+
+BLOCK_ROWS = 256
+
+
+def block_generator(seed_sequence, i):
+    """
+    Returns the np.random.Generator of the i-th block of rows. The child seed sequence is built from
+    the spawn key directly rather than with seed_sequence.spawn, which would depend on how many children
+    were spawned before
+    """
+    child = np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (i,),
+                                   pool_size=seed_sequence.pool_size)
+
+    return np.random.Generator(np.random.PCG64(child))
+
+
+def draw_chunks(rng, start, stop, m, chunk_rows, X=None, **covariance):
+    """
+    Draws the rows start:stop of a block from its stream in chunks of at most chunk_rows rows and yields
+    (chunk start, chunk stop, X_chunk). Every row is drawn as its m entries followed by the shared factors
+    of its correlation model, so the rows don't depend on chunk_rows. The chunks are written into the rows of X
+    if it is given
+
+    Parameters
+    ----------
+    rng: np.random.Generator; stream of the block, past the noise of the block
+    start, stop: int; rows of the block
+    m: int; number of features
+    chunk_rows: int; maximum number of rows in a chunk
+    X: n x m; array or memory map to write the rows into
+    covariance: correlation, rho and corr_block_size, see correlate
+    """
+    num_factors = get_num_factors(m, **covariance)
+
+    for chunk_start in range(start, stop, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, stop)
+
+        if X is not None and num_factors == 0:
+            Z = rng.standard_normal(out=X[chunk_start:chunk_stop])
+        else:
+            Z = rng.standard_normal((chunk_stop - chunk_start, m + num_factors))
+
+        X_chunk = correlate(Z[:, :m], Z[:, m:], **covariance)
+
+        if X is not None and num_factors:
+            X[chunk_start:chunk_stop] = X_chunk
+
+        yield chunk_start, chunk_stop, X_chunk
+
+
+def get_num_factors(m, correlation=None, rho=0., corr_block_size=None):
+    """
+    Returns the number of shared factors drawn with every row
+    """
+    return -(-m // corr_block_size) if correlation == 'block' else 0
+
+
+def get_chunk_rows(m, memory_budget, n_workers=1, covariance=None):
+    """
+    Returns the number of rows in a chunk for n_workers threads to keep their chunks, and as much again
+    for the temporaries of the correlation models, within memory_budget bytes
+    """
+    row_bytes = (m + get_num_factors(m, **(covariance or {}))) * np.dtype(float).itemsize
+
+    return int(np.clip(memory_budget // (2 * n_workers * row_bytes), 1, BLOCK_ROWS))
+
+
+def correlate(X_block, factors, correlation=None, rho=0., corr_block_size=None):
+    """
+    Gives the i.i.d. standard normal rows of X_block the feature covariance of the correlation model, in place
+    and in O(rows m), without factorizing the m x m covariance
+
+    Parameters
+    ----------
+    X_block: rows x m; block of standard normal rows
+    factors: rows x get_num_factors(m); standard normal shared factors of the 'block' model
+    correlation: None, 'ar1' or 'block'
+        'ar1': Toeplitz covariance rho^|i - j|, by the recursion x_j = rho x_{j-1} + sqrt(1 - rho^2) z_j
+            over the features, run as a linear filter along the rows
+        'block': equicorrelated blocks of corr_block_size consecutive features with correlation rho,
+            x_j = sqrt(rho) f_b + sqrt(1 - rho) z_j with one factor f_b shared by the features of the block b
+    rho: float; correlation parameter, in (-1, 1) for 'ar1' and in [0, 1] for 'block'
+    corr_block_size: int; number of features in an equicorrelated block
+    """
+    check_covariance(correlation, rho, corr_block_size)
+
+    if correlation is None:
+        return X_block
+
+    if correlation == 'ar1':
+        scale = np.sqrt(1 - rho ** 2)
+
+        # The filter scales every entry by sqrt(1 - rho^2), the first feature is kept standard normal
+        X_block[:, 0] /= scale
+        X_block[...] = lfilter([scale], [1, -rho], X_block, axis=1)
+
+    elif correlation == 'block':
+        m = X_block.shape[1]
+
+        X_block *= np.sqrt(1 - rho)
+        X_block += np.sqrt(rho) * np.repeat(factors, corr_block_size, axis=1)[:, :m]
+
+    return X_block
+
+
+def check_covariance(correlation=None, rho=0., corr_block_size=None):
+    """
+    Raises ValueError if the parameters don't define one of the correlation models of correlate
+    """
+    if correlation is None:
+        return
+
+    if correlation == 'ar1':
+        if not -1 < rho < 1:
+            raise ValueError("The AR(1) correlation rho must be in (-1, 1)")
+
+    elif correlation == 'block':
+        if not 0 <= rho <= 1:
+            raise ValueError("The block correlation rho must be in [0, 1]")
+
+        if corr_block_size is None or corr_block_size < 1:
+            raise ValueError("The block correlation needs corr_block_size, a positive number of features per block")
+
+    else:
+        raise ValueError(f"Unknown correlation: {correlation}")
+
+
+def get_block_bounds(n, block_rows=BLOCK_ROWS):
+    """
+    Returns the (start, stop) rows of every block
+    """
+    return [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+
+
+class ImplicitDesign(RowBlockDesign):
+    """
+    Gaussian design matrix that is never stored: every block of rows is regenerated from its stream
+    whenever it is needed, which trades random number generation for memory and I/O.
+    The blocks are the ones the synthetic data generators fill X with, so an ImplicitDesign built from
+    the same seed sequence is the same matrix. See RowBlockDesign for the supported products.
+    Every product regenerates the whole matrix, on n_workers threads that each keep one chunk of rows in memory
+
+    Parameters
+    ----------
+    seed_sequence: np.random.SeedSequence or int; seed of the block streams
+    shape: (n, m); shape of the design matrix
+    n_workers: int; number of threads regenerating the blocks, the number of CPUs by default
+    correlation, rho, corr_block_size: feature covariance model, see correlate
+    memory_budget: int; maximum number of bytes the chunks of all the threads are allowed to take
+    """
+
+    def __init__(self, seed_sequence, shape, n_workers=None, correlation=None, rho=0., corr_block_size=None,
+                 memory_budget=2 ** 27):
+        if not isinstance(seed_sequence, np.random.SeedSequence):
+            seed_sequence = np.random.SeedSequence(seed_sequence)
+
+        self.seed_sequence = seed_sequence
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(float)
+
+        self.n_workers = n_workers or os.cpu_count()
+        check_covariance(correlation, rho, corr_block_size)
+
+        self.covariance = dict(correlation=correlation, rho=rho, corr_block_size=corr_block_size)
+        self.bounds = get_block_bounds(self.shape[0])
+        self.chunk_rows = get_chunk_rows(self.shape[1], memory_budget, self.n_workers, self.covariance)
+
+    def __array__(self, dtype=None):
+        """
+        Materializes the whole matrix, for the consumers that only take arrays
+        """
+        X = self[:, :]
+
+        return X if dtype is None else X.astype(dtype)
+
+    def chunks(self, i):
+        """
+        Regenerates the i-th block of rows, yields (start, stop, X_chunk) for its chunks
+        """
+        start, stop = self.bounds[i]
+
+        rng = block_generator(self.seed_sequence, i)
+
+        # The noise of the block comes first in its stream
+        rng.standard_normal((stop - start, 1))
+
+        yield from draw_chunks(rng, start, stop, self.shape[1], self.chunk_rows, **self.covariance)
+
+    def iter_blocks(self):
+        for i in range(len(self.bounds)):
+            yield from self.chunks(i)
+
+    def map_blocks(self, func, reduce=False):
+        """
+        Calls func(start, stop, X_chunk) on every chunk of every block. Every thread takes a contiguous range
+        of blocks and, if reduce is set, sums the results of its chunks, so only one partial result per thread
+        is kept
+        """
+        groups = [group for group in np.array_split(np.arange(len(self.bounds)), self.n_workers) if len(group)]
+
+        def run_group(group):
+            total = None
+
+            for i in group:
+                for start, stop, X_chunk in self.chunks(i):
+                    result = func(start, stop, X_chunk)
+
+                    if reduce:
+                        total = result if total is None else np.add(total, result, out=total)
+
+            return total
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            totals = list(pool.map(run_group, groups))
+
+        return sum(totals) if reduce else None
+
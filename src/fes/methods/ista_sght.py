@@ -1,3 +1,169 @@
+import numpy as np
+
+from fes.methods.iht import as_design_matrix
+
 """
 The implementation of ISTA Sparse Group Hard Thresholding algorithm
-"""
\ No newline at end of file
+"""
+
+
+def sght_reg(X, y, groups, k, k_groups, tol=1e-4, max_iter=100, max_step=50, verbose=False):
+    """
+    Sparse group L0 penalized least-squares regression with ISTA and sparse group hard thresholding
+    Parameters
+    ----------
+    X: n x m; design matrix, dense or scipy.sparse
+    y: n x 1; vector of observations
+    groups: m or m x 1; group label of every feature
+    k: int; desired model (support) size
+    k_groups: int; desired number of selected groups
+    tol: float; global tolerance
+    max_iter: int; maximum number of iterations for the algorithm
+    max_step: int; maximum number of line search steps for the Lipschitz constant
+    verbose: bool; Log flag
+    Returns w: m x 1; vector of weights,
+            sup: m; support set
+    -------
+    """
+    X = as_design_matrix(X)
+
+    # Group labels are mapped to 0..num_groups-1 once, so that all group reductions are bincounts
+    _, labels = np.unique(np.asarray(groups).reshape(-1), return_inverse=True)
+    num_groups = labels.max() + 1
+
+    w_prev = np.zeros((X.shape[1], 1))
+    Xw_prev = np.zeros_like(y, dtype=w_prev.dtype)
+
+    dy_prev = y - Xw_prev
+    loss_prev = (dy_prev ** 2).sum() / 2
+
+    # The Rayleigh quotient along the first gradient is a lower bound of the Lipschitz constant ||X||^2
+    g = X.transpose() @ dy_prev
+    L = (g ** 2).sum() / max(((X @ g) ** 2).sum(), np.finfo(float).tiny)
+
+    for _iter in range(max_iter):
+
+        if _iter == max_iter - 1:
+            raise RuntimeError("ISTA SGHT didn't converge! Maybe you should increase the number of iterations or the tolerance")
+
+        g = X.transpose() @ dy_prev
+
+        w, sup, Xw, loss, L, L_step = sght_step(X, y, w_prev, g, loss_prev, L, k, k_groups, labels, num_groups, max_step)
+
+        if not np.isfinite(loss):
+            raise RuntimeError("The loss is not finite")
+
+        norm = np.linalg.norm((w - w_prev).reshape(-1), ord=np.inf)
+        scaled_norm = norm / (np.linalg.norm(w_prev.reshape(-1), ord=np.inf) + 1)
+
+        converged = scaled_norm < tol
+
+        if verbose:
+            if _iter % max(max_iter // 10, 1) == 0:
+                print(f"Iteration {_iter}, loss {loss:.4f}, weights norm {norm:.4f}, scaled norm {scaled_norm:.4f}")
+                print(f"Lipschitz constant L is {L:.5f}")
+                if L_step != 0:
+                    print(f"Line search finished in {L_step} steps")
+
+        if converged:
+            if verbose:
+                print(f"ISTA SGHT has converged in {_iter} iterations with loss {loss:.4f}, weights norm {norm:.4f}")
+
+            return w, sup
+
+        w_prev = w
+        dy_prev = y - Xw
+        loss_prev = loss
+
+
+def sght_step(X, y, w_prev, g, loss_prev, L, k, k_groups, labels, num_groups, max_step):
+    """
+    A single ISTA step with line search for the Lipschitz constant
+
+    Parameters
+    ----------
+    X: n x m; design matrix
+    y: n x 1; vector of observations
+    w_prev: m x 1; vector of weights
+    g: m x 1; negative gradient X.T @ (y - X @ w_prev)
+    loss_prev: float; loss at w_prev
+    L: float; current estimate of the Lipschitz constant
+    k: int; desired model (support) size
+    k_groups: int; desired number of selected groups
+    labels: m; group indices in 0..num_groups-1
+    num_groups: int; number of groups
+    max_step: int; maximum number of line search steps
+    """
+    L_step = 0
+
+    while True:
+        w, sup = sght(w_prev + g / L, k, k_groups, labels, num_groups)
+
+        Xw = X @ w
+        loss = ((y - Xw) ** 2).sum() / 2
+
+        dw = w - w_prev
+
+        # The quadratic upper bound of the loss around w_prev holds for L
+        if loss <= loss_prev - (g * dw).sum() + L / 2 * (dw ** 2).sum() or L_step == max_step:
+            return w, sup, Xw, loss, L, L_step
+
+        L *= 2
+        L_step += 1
+
+
+"""
+Support utils
+"""
+
+
+def sght(v, k, k_groups, labels, num_groups):
+    """
+    Sparse group hard thresholding: keeps at most k entries of v from at most k_groups groups.
+    Groups are ranked by the energy of their entries among the top k entries of v, then the top k entries
+    within the selected groups are kept. All group reductions are done with bincount over the labels
+
+    Parameters
+    ----------
+    v: m x 1 vector
+    k: int; desired model (support) size
+    k_groups: int; desired number of selected groups
+    labels: m; group indices in 0..num_groups-1
+    num_groups: int; number of groups
+    Returns sup_v: m x 1; thresholded vector,
+            sup: m; support set
+    -------
+    """
+    energy = v.reshape(-1) ** 2
+    m = energy.shape[0]
+
+    k = min(k, m)
+
+    if k_groups < num_groups:
+        top = np.zeros(m, dtype=bool)
+        top[np.argpartition(energy, m - k)[m - k:]] = True
+
+        groups_energy = np.bincount(labels, weights=np.where(top, energy, 0), minlength=num_groups)
+
+        kept_groups = np.zeros(num_groups, dtype=bool)
+        kept_groups[np.argpartition(groups_energy, num_groups - k_groups)[num_groups - k_groups:]] = True
+
+        # Entries of the dropped groups can't be selected
+        energy = np.where(kept_groups[labels], energy, -1)
+
+    topk = np.argpartition(energy, m - k)[m - k:]
+    topk = topk[energy[topk] >= 0]
+
+    sup = np.zeros(m, dtype=bool)
+    sup[topk] = True
+
+    sup_v = np.where(sup.reshape(v.shape), v, 0)
+
+    return sup_v, sup
+
+
+def get_groups_support(sup, groups):
+    """
+    Returns the labels of the groups that have at least one selected feature
+    """
+    return np.unique(np.asarray(groups).reshape(-1)[sup])
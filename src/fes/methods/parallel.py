@@ -0,0 +1,166 @@
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from fes.methods.design import RowBlockDesign
+
+"""
+Row-partitioned design matrices whose products are computed by worker processes
+"""
+
+
+class PartitionedDesign(RowBlockDesign):
+    """
+    Design matrix split into blocks of rows, one per worker. Every product is computed as partial
+    products over the blocks followed by a reduce step here on the coordinator: the partial X_b @ w are
+    concatenated and the partial X_b.T @ r_b are summed. See RowBlockDesign for the supported products.
+
+    The blocks are dispatched through a transport, which only has to implement map(task, bounds, operands)
+    and close(). LocalTransport runs them on a local process pool; a multi-node transport would run
+    the same tasks (see run_task) on remote workers that hold their blocks
+
+    Parameters
+    ----------
+    X: n x m; design matrix
+    n_workers: int; number of row blocks and worker processes, the number of CPUs by default
+    transport: transport to use instead of a LocalTransport
+    blas_threads: int; number of BLAS threads per worker, so that the workers don't oversubscribe the cores
+    """
+
+    def __init__(self, X, n_workers=None, transport=None, blas_threads=1):
+        n_workers = n_workers or os.cpu_count()
+
+        self.shape = X.shape
+        self.dtype = np.dtype(X.dtype)
+
+        edges = np.linspace(0, X.shape[0], n_workers + 1).astype(int)
+        self.bounds = [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+        self.transport = transport or LocalTransport(X, len(self.bounds), blas_threads)
+
+    def product(self, w):
+        return np.concatenate(self.map('product', w))
+
+    def support_product(self, idx, w):
+        return np.concatenate(self.map('support_product', (idx, w)))
+
+    def gather(self, cols):
+        return np.concatenate(self.map('gather', cols))
+
+    def rproduct(self, r):
+        return sum(self.map('rproduct', r, split=True))
+
+    def gram(self):
+        return sum(self.map('gram', None))
+
+    def map(self, task, operand, split=False):
+        """
+        Runs the task on every block. The operand is either shared by all the blocks or, if split is set,
+        sliced by the rows of each block
+        """
+        operands = [operand[start:stop] for start, stop in self.bounds] if split else [operand] * len(self.bounds)
+
+        return self.transport.map(task, self.bounds, operands)
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalTransport:
+    """
+    Copies X into a shared memory block once and runs the tasks on a local process pool.
+    The workers attach the block without copying it, so only the operands and the partial
+    results travel between the processes
+    """
+
+    def __init__(self, X, n_workers, blas_threads=1):
+        X = np.asarray(X)
+
+        self.shm = SharedMemory(create=True, size=max(1, X.nbytes))
+        np.ndarray(X.shape, dtype=X.dtype, buffer=self.shm.buf)[...] = X
+
+        self.pool = ProcessPoolExecutor(max_workers=n_workers, initializer=attach,
+                                        initargs=(self.shm.name, X.shape, X.dtype.str, blas_threads))
+
+        self.finalizer = weakref.finalize(self, release, self.pool, self.shm)
+
+    def map(self, task, bounds, operands):
+        futures = [self.pool.submit(run_task, task, start, stop, operand)
+                   for (start, stop), operand in zip(bounds, operands)]
+
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.finalizer()
+
+
+"""
+Worker side
+"""
+
+worker_state = {}
+
+
+def attach(shm_name, shape, dtype, blas_threads):
+    """
+    Initializer of the worker processes: attaches the shared design matrix and caps the BLAS threads
+    """
+    # The workers share the resource tracker of the coordinator, which owns and unlinks the block
+    shm = SharedMemory(name=shm_name)
+
+    worker_state['shm'] = shm
+    worker_state['X'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    if blas_threads is not None:
+        try:
+            from threadpoolctl import threadpool_limits
+
+            worker_state['limits'] = threadpool_limits(limits=blas_threads, user_api='blas')
+
+        except ImportError:
+            pass
+
+
+def run_task(task, start, stop, operand):
+    """
+    Computes the partial result of the task on the rows start:stop of the design matrix
+    """
+    X_block = worker_state['X'][start:stop]
+
+    if task == 'product':
+        return X_block @ operand
+
+    elif task == 'support_product':
+        idx, w = operand
+
+        return X_block[:, idx] @ w
+
+    elif task == 'rproduct':
+        return X_block.transpose() @ operand
+
+    elif task == 'gram':
+        X_block = X_block.astype(np.float64, copy=False)
+
+        return X_block.transpose() @ X_block
+
+    elif task == 'gather':
+        return np.array(X_block[:, operand])
+
+    else:
+        raise ValueError(f"Unknown task: {task}")
+
+
+def release(pool, shm):
+    pool.shutdown()
+
+    shm.close()
+    shm.unlink()
@@ -0,0 +1,320 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from sklearn.inspection import permutation_importance as sklearn_permutation_importance
+from sklearn.utils import Bunch, check_random_state
+
+from fes.methods.parallel import attach, release, worker_state
+
+"""
+Permutation importance with fast paths for linear regressors
+"""
+
+
+def permutation_importance(regressor, X, y, n_repeats=5, random_state=None, n_jobs=None, blas_threads=1,
+                           batched=False, memory_budget=2 ** 28):
+    """
+    Permutation importance of every feature with the R2 score of the regressor, a drop-in replacement
+    for sklearn.inspection.permutation_importance with the default scoring.
+    Linear regressors are scored with rank-1 updates of the residual (see linear_permutation_importance),
+    any other regressor goes through sklearn, through stacked predictions if batched is set
+    (see batched_permutation_importance) or through a process pool sharing X if n_jobs is set
+    (see parallel_permutation_importance). All paths draw the same permutations from random_state,
+    so they return the same importances up to rounding
+
+    Parameters
+    ----------
+    regressor: fitted regressor compatible with sklearn interface
+    X: n x m; design matrix
+    y: n x 1; vector of observations
+    n_repeats: int; number of permutations of every feature
+    random_state: int, RandomState or None; source of the permutations
+    n_jobs: int; number of worker processes for non-linear regressors, -1 for the number of CPUs
+    blas_threads: int; number of BLAS threads per worker process
+    batched: bool; whether the regressor can predict stacked permuted copies of X in one call
+    memory_budget: int; maximum number of bytes the stacked permuted blocks are allowed to take
+    Returns results: Bunch with importances_mean (m), importances_std (m) and importances (m x n_repeats)
+    -------
+    """
+    if is_linear(regressor, X, y):
+        return linear_permutation_importance(regressor, X, y, n_repeats=n_repeats, random_state=random_state)
+
+    if batched:
+        return batched_permutation_importance(regressor, X, y, n_repeats=n_repeats, random_state=random_state,
+                                              memory_budget=memory_budget)
+
+    if n_jobs is not None and n_jobs != 1:
+        return parallel_permutation_importance(regressor, X, y, n_repeats=n_repeats, random_state=random_state,
+                                               n_workers=None if n_jobs == -1 else n_jobs, blas_threads=blas_threads)
+
+    return sklearn_permutation_importance(regressor, X, y, n_repeats=n_repeats, random_state=random_state)
+
+
+def linear_permutation_importance(regressor, X, y, n_repeats=5, random_state=None):
+    """
+    Permutation importance of a linear regressor y_hat = X @ c + b without calling predict.
+    Permuting the column x_j by p changes the residual r = y - y_hat by the rank-1 term
+    dr = c_j (x_j[p] - x_j), so the drop of the R2 score is (||dr||^2 - 2 r.dr) / ||y - mean(y)||^2
+    and every repeat costs O(n) instead of a full O(n m) prediction
+    """
+    X = np.asarray(X)
+    y = np.asarray(y).reshape(-1)
+
+    c = get_coef(regressor)
+
+    r = y - X @ c - get_intercept(regressor)
+    ss_tot = ((y - y.mean()) ** 2).sum()
+
+    perms = get_permutations(X.shape[0], n_repeats, random_state)
+
+    importances = np.empty((X.shape[1], n_repeats))
+
+    for j in range(X.shape[1]):
+        x = X[:, j]
+
+        dr = c[j] * (x[perms] - x)
+
+        importances[j] = ((dr ** 2).sum(axis=1) - 2 * (dr @ r)) / ss_tot
+
+    return Bunch(importances_mean=importances.mean(axis=1), importances_std=importances.std(axis=1),
+                 importances=importances)
+
+
+def batched_permutation_importance(regressor, X, y, n_repeats=5, random_state=None, memory_budget=2 ** 28):
+    """
+    Permutation importance of a single target regressor scored with R2, whose predict is called
+    on stacked permuted copies of X: every (feature, repeat) pair of a batch gets its own copy of X
+    with that feature permuted, and the copies are predicted at once as one (batch * n) x m array.
+    The batch size is the number of copies that fit into memory_budget
+    """
+    X = np.asarray(X)
+    y = np.asarray(y).reshape(-1)
+
+    n, m = X.shape
+
+    ss_tot = ((y - y.mean()) ** 2).sum()
+    baseline = 1 - ((y - np.asarray(regressor.predict(X)).reshape(-1)) ** 2).sum() / ss_tot
+
+    perms = get_permutations(n, n_repeats, random_state)
+
+    importances = np.empty((m, n_repeats))
+
+    pairs = [(j, p) for j in range(m) for p in range(n_repeats)]
+    batch = get_block_size(X.nbytes, memory_budget)
+
+    # The copies are made once, afterwards only the permuted column of every copy is written and restored
+    X_stacked = np.empty((min(batch, len(pairs)), n, m), dtype=X.dtype)
+    X_stacked[...] = X
+
+    for start in range(0, len(pairs), batch):
+        batch_pairs = pairs[start:start + batch]
+
+        X_batch = X_stacked[:len(batch_pairs)]
+
+        for i, (j, p) in enumerate(batch_pairs):
+            X_batch[i, :, j] = X[perms[p], j]
+
+        y_hat = np.asarray(regressor.predict(X_batch.reshape(-1, m))).reshape(len(batch_pairs), n)
+
+        for i, (j, _) in enumerate(batch_pairs):
+            X_batch[i, :, j] = X[:, j]
+
+        scores = 1 - ((y - y_hat) ** 2).sum(axis=1) / ss_tot
+
+        for (j, p), score in zip(batch_pairs, scores):
+            importances[j, p] = baseline - score
+
+    return Bunch(importances_mean=importances.mean(axis=1), importances_std=importances.std(axis=1),
+                 importances=importances)
+
+
+def parallel_permutation_importance(regressor, X, y, n_repeats=5, random_state=None, n_workers=None,
+                                    repeats_per_task=None, blas_threads=1):
+    """
+    Permutation importance of any regressor, with the feature x repeat tasks spread over a process pool.
+    X is copied into a shared memory block once and the workers attach it without copying,
+    the regressor and y are sent once per worker. The scores are collected as the tasks finish
+
+    Parameters
+    ----------
+    regressor: fitted regressor compatible with sklearn interface
+    X: n x m; design matrix
+    y: n x 1; vector of observations
+    n_repeats: int; number of permutations of every feature
+    random_state: int, RandomState or None; source of the permutations
+    n_workers: int; number of worker processes, the number of CPUs by default
+    repeats_per_task: int; number of repeats of a feature scored by one task, all of them by default
+    blas_threads: int; number of BLAS threads per worker, so that the workers don't oversubscribe the cores
+    Returns results: Bunch with importances_mean (m), importances_std (m) and importances (m x n_repeats)
+    -------
+    """
+    X = np.asarray(X)
+
+    baseline = regressor.score(X, y)
+
+    importances = np.empty((X.shape[1], n_repeats))
+
+    for j, repeats, scores in iter_permutation_scores(regressor, X, y, n_repeats, random_state, n_workers,
+                                                       repeats_per_task, blas_threads):
+        importances[j, repeats] = baseline - scores
+
+    return Bunch(importances_mean=importances.mean(axis=1), importances_std=importances.std(axis=1),
+                 importances=importances)
+
+
+def iter_permutation_scores(regressor, X, y, n_repeats=5, random_state=None, n_workers=None,
+                            repeats_per_task=None, blas_threads=1):
+    """
+    Yields (j, repeats, scores) with the scores of the regressor on X with the column j permuted,
+    for the slice of repeats of a task, in the order the tasks finish
+    """
+    X = np.asarray(X)
+
+    n_workers = n_workers or os.cpu_count()
+    repeats_per_task = repeats_per_task or n_repeats
+
+    perms = get_permutations(X.shape[0], n_repeats, random_state)
+
+    shm = SharedMemory(create=True, size=max(1, X.nbytes))
+    np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=attach_scoring,
+                               initargs=(shm.name, X.shape, X.dtype.str, blas_threads, regressor, y))
+
+    try:
+        futures = {}
+
+        for j in range(X.shape[1]):
+            for start in range(0, n_repeats, repeats_per_task):
+                repeats = slice(start, min(start + repeats_per_task, n_repeats))
+
+                futures[pool.submit(score_permutations, j, perms[repeats])] = j, repeats
+
+        for future in as_completed(futures):
+            j, repeats = futures[future]
+
+            yield j, repeats, future.result()
+
+    finally:
+        release(pool, shm)
+
+
+def expected_linear_importance(regressor, X, y):
+    """
+    Expectation of the permutation importance of a linear regressor over uniformly random permutations.
+    Since E[x_j[p]] = mean(x_j) entrywise, it only depends on the coefficients and the column moments:
+    (2 n c_j^2 var(x_j) - 2 c_j (n mean(r) mean(x_j) - r.x_j)) / ||y - mean(y)||^2
+    """
+    X = np.asarray(X)
+    y = np.asarray(y).reshape(-1)
+
+    n = X.shape[0]
+    c = get_coef(regressor)
+
+    r = y - regressor.predict(X).reshape(-1)
+    ss_tot = ((y - y.mean()) ** 2).sum()
+
+    return (2 * n * c ** 2 * X.var(axis=0) - 2 * c * (n * r.mean() * X.mean(axis=0) - r @ X)) / ss_tot
+
+
+"""
+Worker side
+"""
+
+
+def attach_scoring(shm_name, shape, dtype, blas_threads, regressor, y):
+    """
+    Initializer of the scoring workers: attaches the shared design matrix and keeps the regressor and y
+    """
+    attach(shm_name, shape, dtype, blas_threads)
+
+    worker_state['regressor'] = regressor
+    worker_state['y'] = y
+
+    # Private copy of X whose columns are permuted in place, one per worker rather than one per task
+    worker_state['X_permuted'] = np.array(worker_state['X'])
+
+
+def score_permutations(j, perms):
+    """
+    Returns the scores of the regressor with the column j of X permuted by every permutation
+    """
+    x = worker_state['X'][:, j]
+    X_permuted = worker_state['X_permuted']
+
+    scores = np.empty(len(perms))
+
+    for i, perm in enumerate(perms):
+        X_permuted[:, j] = x[perm]
+        scores[i] = worker_state['regressor'].score(X_permuted, worker_state['y'])
+
+    X_permuted[:, j] = x
+
+    return scores
+
+
+"""
+Support utils
+"""
+
+
+def is_linear(regressor, X, y, num_rows=8):
+    """
+    Checks that the regressor is a fitted single target linear model whose predictions are X @ coef_ + intercept_,
+    on the first rows of X
+    """
+    if not hasattr(regressor, 'coef_') or not hasattr(regressor, 'intercept_') or not hasattr(X, 'shape'):
+        return False
+
+    if np.size(regressor.coef_) != X.shape[1] or np.size(regressor.intercept_) > 1:
+        return False
+
+    # Multi target scores are averaged over the targets, which the rank-1 updates don't cover
+    if np.ndim(y) > 1 and np.shape(y)[1] > 1:
+        return False
+
+    X_head = np.asarray(X[:num_rows])
+    y_head = np.asarray(regressor.predict(X_head)).reshape(-1)
+
+    return np.allclose(y_head, X_head @ get_coef(regressor) + get_intercept(regressor))
+
+
+def get_block_size(item_nbytes, memory_budget):
+    """
+    Returns how many items of item_nbytes bytes fit into memory_budget, at least one
+    """
+    return max(1, int(memory_budget // max(item_nbytes, 1)))
+
+
+def get_coef(regressor):
+    return np.asarray(regressor.coef_, dtype=float).reshape(-1)
+
+
+def get_intercept(regressor):
+    return np.asarray(regressor.intercept_, dtype=float).sum()
+
+
+def get_permutations(n, n_repeats, random_state=None):
+    """
+    Returns n_repeats x n permutations drawn in the same way as sklearn's permutation_importance:
+    a seed is drawn from random_state and every repeat shuffles the column that the previous repeat left
+    permuted, so the permutations of the original column are compositions of the shuffles
+    """
+    random_state = check_random_state(random_state)
+    random_seed = random_state.randint(np.iinfo(np.int32).max + 1)
+
+    rng = np.random.RandomState(random_seed)
+
+    perms = np.empty((n_repeats, n), dtype=np.intp)
+    shuffling_idx = np.arange(n)
+    perm = np.arange(n)
+
+    for i in range(n_repeats):
+        rng.shuffle(shuffling_idx)
+        perm = perm[shuffling_idx]
+        perms[i] = perm
+
+    return perms
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from fes.methods.design import RowBlockDesign
+
+"""
+Out-of-core design matrices for the IHT solvers
+"""
+
+
+class ChunkedDesign(RowBlockDesign):
+    """
+    Design matrix that stays on disk and is processed in blocks of rows.
+    Only two blocks are kept in memory at once: the one being multiplied and the next one,
+    which is read on a background thread in the meantime. See RowBlockDesign for the supported products
+
+    Parameters
+    ----------
+    source: np.memmap, path to a .npy file or any n x m array-like that supports slicing by rows
+        (e.g. a Zarr array)
+    chunk_rows: int; number of rows in a block, derived from memory_budget by default
+    memory_budget: int; maximum number of bytes the blocks in memory are allowed to take
+    prefetch: bool; whether to read the next block on a background thread
+    """
+
+    def __init__(self, source, chunk_rows=None, memory_budget=2 ** 27, prefetch=True):
+        if isinstance(source, (str, Path)):
+            source = np.load(source, mmap_mode='r')
+
+        self.source = source
+        self.shape = source.shape
+        self.dtype = np.dtype(source.dtype)
+
+        if chunk_rows is None:
+            chunk_rows = memory_budget // (2 * self.shape[1] * self.dtype.itemsize)
+
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.prefetch = prefetch
+
+    def iter_blocks(self):
+        """
+        Yields (start, stop, block) for consecutive blocks of rows
+        """
+        bounds = [(start, min(start + self.chunk_rows, self.shape[0]))
+                  for start in range(0, self.shape[0], self.chunk_rows)]
+
+        if not self.prefetch:
+            for start, stop in bounds:
+                yield start, stop, self.read(start, stop)
+
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(self.read, *bounds[0])
+
+            for i, (start, stop) in enumerate(bounds):
+                block = future.result()
+
+                if i + 1 < len(bounds):
+                    future = pool.submit(self.read, *bounds[i + 1])
+
+                yield start, stop, block
+
+    def read(self, start, stop):
+        block = self.source[start:stop]
+
+        # Slices of a memmap are still backed by the file, copying is what actually reads them
+        if isinstance(block, np.memmap) or not isinstance(block, np.ndarray):
+            block = np.array(block)
+
+        return block
+
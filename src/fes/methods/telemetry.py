@@ -0,0 +1,147 @@
+import time
+from collections import deque
+
+import numpy as np
+
+"""
+Per-iteration telemetry of the IHT solvers. A callback is any callable taking the record of an iteration,
+a dict with the keys
+    iteration: int; iteration index
+    k: int; support size
+    loss: float; loss after the iteration
+    mu: float; final gradient step size
+    mu_step: int; number of backtracking steps
+    support_changes: int; number of features that entered the support (as many left it)
+    norm, scaled_norm: float; max absolute change of the weights, unscaled and scaled as for the tolerance
+    converged: bool; whether the iteration met the tolerance
+    timings: dict; seconds spent in the phases of the iteration: gradient, step_size, threshold, product,
+        backtracking and loss, plus solve for HTP and conjugate_gradient for CGIHT
+The multi-target solver reports loss, mu, mu_step, support_changes and scaled_norm per active target
+as arrays, plus the number of active targets.
+Without a callback the solvers neither time the phases nor build the records
+"""
+
+
+class Trace:
+    """
+    Keeps every record in memory
+
+    Parameters
+    ----------
+    fields: list of str; keys of the records to keep, all by default
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields
+        self.records = []
+
+    def __call__(self, record):
+        if self.fields is not None:
+            record = {field: record[field] for field in self.fields}
+
+        self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, field):
+        """
+        Returns the values of the field over the records as an array, the timings of a phase by 'timings.<phase>'
+        """
+        if field.startswith('timings.'):
+            phase = field[len('timings.'):]
+
+            return np.array([record['timings'].get(phase, 0.) for record in self.records])
+
+        return np.array([record[field] for record in self.records])
+
+    def clear(self):
+        self.records.clear()
+
+
+class RingBuffer(Trace):
+    """
+    Keeps the last size records only, so long or repeated solves can be monitored in constant memory
+
+    Parameters
+    ----------
+    size: int; number of records to keep
+    fields: see Trace
+    """
+
+    def __init__(self, size=100, fields=None):
+        super().__init__(fields)
+
+        self.records = deque(maxlen=size)
+
+
+class ProgressPrinter:
+    """
+    Prints the progress every `every` iterations, the verbose output of the solvers
+    """
+
+    def __init__(self, every=1):
+        self.every = max(every, 1)
+
+    def __call__(self, record):
+        if record['iteration'] % self.every != 0:
+            return
+
+        if np.ndim(record['loss']) > 0:
+            print(f"Iteration {record['iteration']}, {record['active']} active targets, "
+                  f"mean loss {np.mean(record['loss']):.4f}, max scaled norm {np.max(record['scaled_norm']):.4f}")
+
+            return
+
+        print(f"Iteration {record['iteration']}, loss {record['loss']:.4f}, weights norm {record['norm']:.4f}, "
+              f"scaled norm {record['scaled_norm']:.4f}")
+        print(f"Gradient step size mu is {record['mu']:.5f}")
+
+        if record['mu_step'] != 0:
+            print(f"Backtracking finished in {record['mu_step']} steps")
+
+
+class Callbacks:
+    """
+    Calls several callbacks in turn
+    """
+
+    def __init__(self, callbacks):
+        self.callbacks = list(callbacks)
+
+    def __call__(self, record):
+        for callback in self.callbacks:
+            callback(record)
+
+
+class PhaseTimer:
+    """
+    Accumulates the time between consecutive laps into the phase named by the lap
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+
+        self.timings[phase] = self.timings.get(phase, 0.) + now - self.last
+        self.last = now
+
+
+def get_callback(callback=None, verbose=False, max_iter=100):
+    """
+    Returns the callback of a solve: the given one, combined with a ProgressPrinter reporting ten times
+    over max_iter iterations if verbose is set, or None for no telemetry
+    """
+    if not verbose:
+        return callback
+
+    printer = ProgressPrinter(max_iter // 10)
+
+    return printer if callback is None else Callbacks([callback, printer])
+
+
+def get_timer(callback):
+    return None if callback is None else PhaseTimer()
@@ -42,11 +42,15 @@ def register_pipelines() -> Dict[str, Pipeline]:
         A mapping from a pipeline name to a ``Pipeline`` object.
     """
     synth_dataset = dpp.synth_test_data_pipeline()
+    synth_grouped_dataset = dpp.synth_grouped_data_pipeline()
     perm_importance = dsp.perm_importance_pipeline()
     iht_importance = dsp.iht_pipeline()
+    sght_importance = dsp.sght_pipeline()
 
     return {
         "__default__": synth_dataset + perm_importance,
         "synth_pi": synth_dataset + perm_importance,
-        "synth_iht": synth_dataset + iht_importance
+        "synth_iht": synth_dataset + iht_importance,
+        "synth_grouped_iht": synth_grouped_dataset + iht_importance,
+        "synth_sght": synth_grouped_dataset + sght_importance
     }
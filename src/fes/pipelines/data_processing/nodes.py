@@ -1,16 +1,37 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from numpy import random
 
+from fes.methods.implicit import (ImplicitDesign, block_generator, check_covariance, draw_chunks, get_block_bounds,
+                                  get_chunk_rows)
+
+# Version of the generated data. It has to be bumped whenever the generators produce different data for the same
+# parameters: it salts the keys of the synthetic dataset cache and ties the perf gate baseline to its data
+DATA_VERSION = 2
 
-def arrange_synth_test_data(parameters):
-    parameters = {k: parameters[k] for k in parameters["synthetic_data_params_list"]}
-    option = parameters.pop('option')
+
+def arrange_synth_test_data(parameters, synth_test_data=None):
+    """
+    Generates the synthetic dataset, or loads it from synth_test_data (a SyntheticDataset cache)
+    if it was generated before with the same parameters
+    """
+    data_parameters = {k: parameters[k] for k in parameters["synthetic_data_params_list"]}
+    option = data_parameters.pop('option')
 
     if option == 'sparse':
-        y, X, w, y_true, features_mask = generate_sparse_data(**parameters)
+        y, X, w, y_true, features_mask = generate(generate_sparse_data, data_parameters, synth_test_data,
+                                                  ["y", "X", "w", "y_true", "features_mask"])
+
+    elif option == 'grouped':
+        # The groups labels are dropped, the grouped pipeline (see arrange_synth_grouped_data) keeps them
+        data_parameters.pop('poly_degree')
+        data_parameters['num_groups'] = parameters['num_groups']
 
-    # elif option == 'grouped':
-    #     y, X, w, y_true, features_mask = generate_grouped_data(**parameters)
+        y, X, w, y_true, features_mask, _ = generate(
+            generate_grouped_data, data_parameters, synth_test_data,
+            ["y", "X", "w", "y_true", "features_mask", "groups_labels"])
 
     else:
         raise NotImplementedError
@@ -18,8 +39,40 @@ def arrange_synth_test_data(parameters):
     return y, X, w, y_true, features_mask
 
 
-def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_degree, seed):
+def arrange_synth_grouped_data(parameters, synth_test_data=None):
+    """
+    Generates the synthetic grouped dataset, or loads it from synth_test_data (a SyntheticDataset cache)
+    if it was generated before with the same parameters
+    """
+    parameters = {k: parameters[k] for k in parameters["synthetic_grouped_data_params_list"]}
+
+    y, X, w, y_true, features_mask, groups_labels = generate(
+        generate_grouped_data, parameters, synth_test_data, ["y", "X", "w", "y_true", "features_mask", "groups_labels"])
+
+    return y, X, w, y_true, features_mask, groups_labels
+
+
+def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_degree, seed, correlation=None,
+                         rho=0., corr_block_size=None, filepath=None, n_workers=None, implicit=False,
+                         chunk_rows=None, memory_budget=2 ** 27):
     """
+    All the random draws come from np.random.SeedSequence(seed): the model from one child stream and every block of
+    rows of X and of the noise from its own stream, spawned by the block index (see fes.methods.implicit).
+    The blocks are filled on a thread pool in chunks of rows, and the dataset is bit-identical for a seed whatever
+    the number of workers and the chunks. If filepath is given, the chunks of X are written straight into a .npy
+    memory map at filepath, so the memory use depends neither on n nor on m. If implicit is set, X is not stored
+    at all but returned as an ImplicitDesign that regenerates its blocks when needed
+
+    Parameters
+    ----------
+    correlation: None, 'ar1' or 'block'; feature covariance model, i.i.d. features if None
+    rho: float; correlation parameter of the model
+    corr_block_size: int; number of features in an equicorrelated block
+    filepath: str; .npy file to stream X into, X is generated in memory if None
+    n_workers: int; number of threads filling the blocks, the number of CPUs by default
+    implicit: bool; whether to return X as an ImplicitDesign
+    chunk_rows: int; number of rows a thread draws at once, derived from memory_budget by default
+    memory_budget: int; maximum number of bytes the chunks of all the threads are allowed to take
     Returns y: vector of observations (n,1),
             X: design matrix (n, m)
             w: vector of true coefficients (m,1)
@@ -29,14 +82,16 @@ def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_d
     """
     if seed is not None:
         print(f"The seed for the synthetic dataset generation is set to {seed}", end='\n\n')
-        random.seed(seed)
+
+    model_seed, data_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(model_seed)
 
     w = np.zeros((m, 1))
 
     # Decide the number of features and their locations
-    num_sparse_feat = np.clip(random.binomial(m, 1 - redundancy_rate), a_min=1, a_max=None)
+    num_sparse_feat = np.clip(rng.binomial(m, 1 - redundancy_rate), a_min=1, a_max=None)
 
-    sparse_feat_idx = random.choice(m, num_sparse_feat, replace=False)
+    sparse_feat_idx = rng.choice(m, num_sparse_feat, replace=False)
 
     # Trim idx to poly_degree
     if poly_degree is not None:
@@ -45,12 +100,12 @@ def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_d
 
     # Fill features with values
     if features_fill == "const":
-        w[sparse_feat_idx] = random.randint(1, 4 * m, (num_sparse_feat, 1))
+        w[sparse_feat_idx] = rng.integers(1, 4 * m, (num_sparse_feat, 1))
 
     elif features_fill == "normal":
         for i in range(poly_degree):
             if i == 0:
-                w[sparse_feat_idx[:, i]] = random.standard_normal((num_poly, 1))
+                w[sparse_feat_idx[:, i]] = rng.standard_normal((num_poly, 1))
 
             else:
                 w[sparse_feat_idx[:, i]] = w[sparse_feat_idx[:, i - 1]] * w[sparse_feat_idx[:, 0]]
@@ -61,10 +116,9 @@ def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_d
     features_mask = w != 0
 
     # Generate observations
-    X = random.standard_normal((n, m))
-
-    y_true = X @ w
-    y = y_true + np.random.standard_normal((n, 1)) * noise_std
+    y, X, y_true = generate_observations(data_seed, n, m, w, noise_std, filepath, n_workers, implicit, chunk_rows,
+                                         memory_budget, correlation=correlation, rho=rho,
+                                         corr_block_size=corr_block_size)
 
     print("Synthetic sparse test dataset is generated")
     print(f"Number of observations: {n}, features dim. {m}, number of informative features {sum(features_mask.reshape(-1))}")
@@ -74,53 +128,159 @@ def generate_sparse_data(n, m, noise_std, redundancy_rate, features_fill, poly_d
     return y, X, w, y_true, features_mask
 
 
-def generate_grouped_data(n, m, noise_std, redundancy_rate, features_fill, num_groups, seed):
+def generate_grouped_data(n, m, noise_std, redundancy_rate, features_fill, num_groups, seed, correlation=None,
+                          rho=0., corr_block_size=None, filepath=None, n_workers=None, implicit=False,
+                          chunk_rows=None, memory_budget=2 ** 27):
+    """
+    The random draws are organized as in generate_sparse_data. The group boundaries, the keep flags of all
+    the groups and their values are drawn at once, in this order, from the model stream, so for a seed
+    the dataset is the same across runs, numbers of workers and the in-memory, streamed and implicit modes
+
+    Parameters
+    ----------
+    correlation: None, 'ar1' or 'block'; feature covariance model, i.i.d. features if None
+    rho: float; correlation parameter of the model
+    corr_block_size: int; number of features in an equicorrelated block
+    filepath: str; .npy file to stream X into, X is generated in memory if None
+    n_workers: int; number of threads filling the blocks, the number of CPUs by default
+    implicit: bool; whether to return X as an ImplicitDesign
+    chunk_rows: int; number of rows a thread draws at once, derived from memory_budget by default
+    memory_budget: int; maximum number of bytes the chunks of all the threads are allowed to take
+    Returns y: vector of observations (n,1),
+            X: design matrix (n, m)
+            w: vector of true coefficients (m,1)
+            y_true: vector of noiseless observations (n,1)
+            features_mask: (m,1) informative features mask
+            groups_labels: (m,1) group label of every feature, from 1 to num_groups
+    -------
+    """
     if seed is not None:
         print(f"The seed for the synthetic dataset generation is set to {seed}", end='\n\n')
-        random.seed(seed)
     if num_groups is None or num_groups < 2:
         raise ValueError("The number of groups cannot be None or less than 2")
 
+    model_seed, data_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(model_seed)
+
     # Split x_hat into groups
-    group_end_idx = random.choice(m - 2, num_groups - 1, replace=False) + 1
+    group_end_idx = rng.choice(m - 2, num_groups - 1, replace=False) + 1
     group_end_idx.sort()
 
-    w, groups_labels = np.zeros((m, 1)), np.zeros((m, 1))
+    groups_sizes = np.diff(np.concatenate([[0], group_end_idx, [m]]))
 
-    _x_hat, _groups_labels = (
-        np.split(w, group_end_idx),
-        np.split(groups_labels, group_end_idx),
-    )
+    groups_labels = np.repeat(np.arange(1, num_groups + 1), groups_sizes).reshape(m, 1).astype(float)
 
-    # Decide whether to keep the group and fill it with values if needed
-    for i, (x_hat_group, group_labels) in enumerate(zip(_x_hat, _groups_labels)):
-        if i == 0 or random.binomial(1, 1 - redundancy_rate) == 1:
-            group_labels[:] = i + 1
+    # Decide which groups to keep at once, the first one is always kept
+    keep = rng.binomial(1, 1 - redundancy_rate, num_groups).astype(bool)
+    keep[0] = True
 
-            if features_fill == "const":
-                x_hat_group[:] = random.randint(1, 4 * num_groups)
+    # Fill the kept groups with values, either one constant per group or one normal per feature
+    if features_fill == "const":
+        w = np.repeat(np.where(keep, rng.integers(1, 4 * num_groups, num_groups), 0), groups_sizes)
 
-            elif features_fill == "normal":
-                x_hat_group[:] = random.standard_normal(x_hat_group.shape)
+    elif features_fill == "normal":
+        w = np.where(np.repeat(keep, groups_sizes), rng.standard_normal(m), 0)
 
-            else:
-                raise ValueError(f"Unknown fill value: {features_fill}")
+    else:
+        raise ValueError(f"Unknown fill value: {features_fill}")
+
+    w = w.reshape(m, 1).astype(float)
 
     features_mask = w != 0
 
     # Generate observations
-    X = random.standard_normal((n, m))
+    y, X, y_true = generate_observations(data_seed, n, m, w, noise_std, filepath, n_workers, implicit, chunk_rows,
+                                         memory_budget, correlation=correlation, rho=rho,
+                                         corr_block_size=corr_block_size)
 
-    y_true = X @ w
-    y = y_true + np.random.standard_normal((n)) * noise_std
+    print("Synthetic grouped test dataset is generated")
+    print(f"Number of observations: {n}, features dim. {m}, number of informative features {sum(features_mask.reshape(-1))}")
+    print(f"Number of groups: {num_groups}, number of informative groups {len(np.unique(groups_labels[features_mask]))}")
+    print(f"Observations SNR: {calculate_snr(y_true, noise_std):.3f} dB")
+    print(f"Features fill: {features_fill}", end="\n\n")
 
     return y, X, w, y_true, features_mask, groups_labels
 
 
+def generate_observations(seed_sequence, n, m, w, noise_std, filepath=None, n_workers=None, implicit=False,
+                          chunk_rows=None, memory_budget=2 ** 27, **covariance):
+    """
+    Generates X block by block, every block of rows from its own stream: first the noise of the block, then its rows
+    with the shared factors of their correlation model if any (see fes.methods.implicit.draw_chunks). A block
+    is drawn in chunks of chunk_rows rows, so a thread keeps one chunk in memory whatever the number of features.
+    The threads write their chunks into disjoint rows, the random draws and the products release the GIL
+    Returns y: vector of observations (n,1),
+            X: design matrix (n, m), a read-only memory map if filepath is given, an ImplicitDesign if implicit is set
+            y_true: vector of noiseless observations (n,1)
+    -------
+    """
+    check_covariance(**covariance)
+
+    n_workers = n_workers or os.cpu_count()
+
+    if chunk_rows is None:
+        chunk_rows = get_chunk_rows(m, memory_budget, n_workers, covariance)
+
+    if implicit:
+        X = None
+
+    elif filepath is None:
+        X = np.empty((n, m))
+
+    else:
+        X = np.lib.format.open_memmap(filepath, mode='w+', dtype=float, shape=(n, m))
+
+    y, y_true = np.empty((n, 1)), np.empty((n, 1))
+
+    def fill_block(i, start, stop):
+        rng = block_generator(seed_sequence, i)
+
+        noise = rng.standard_normal((stop - start, 1))
+
+        for chunk_start, chunk_stop, X_chunk in draw_chunks(rng, start, stop, m, chunk_rows, X, **covariance):
+            # Sums over every row, the BLAS products would round differently for different chunks
+            np.sum(X_chunk * w.reshape(-1), axis=1, keepdims=True, out=y_true[chunk_start:chunk_stop])
+
+            if filepath is not None and not implicit:
+                # The written pages are flushed, so that they don't pile up in memory
+                X.flush()
+
+        y[start:stop] = y_true[start:stop] + noise * noise_std
+
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for future in [pool.submit(fill_block, i, start, stop) for i, (start, stop) in enumerate(get_block_bounds(n))]:
+            future.result()
+
+    elapsed = time.perf_counter() - start_time
+
+    if implicit:
+        X = ImplicitDesign(seed_sequence, (n, m), n_workers, memory_budget=memory_budget, **covariance)
+
+    elif filepath is not None:
+        del X
+
+        print(f"X is written to {filepath} in {elapsed:.2f} s: {n / elapsed:.0f} rows/s, "
+              f"{n * m * np.dtype(float).itemsize / elapsed / 2 ** 20:.1f} MB/s")
+
+        X = np.load(filepath, mmap_mode='r')
+
+    return y, X, y_true
+
+
 """
 Support utils
 """
 
 
+def generate(generator, parameters, cache, names):
+    # An implicit X takes no space, there is nothing worth caching
+    if cache is None or parameters.get('implicit'):
+        return generator(**parameters)
+
+    return cache.get_or_generate(generator, parameters, names)
+
+
 def calculate_snr(y_true, noise_std):
     return (20 * np.log10(abs(np.where(noise_std == 0, 0, y_true / noise_std)))).mean()
@@ -1,6 +1,6 @@
 from kedro.pipeline import Pipeline, node
 
-from .nodes import arrange_synth_test_data
+from .nodes import arrange_synth_test_data, arrange_synth_grouped_data
 
 
 # Here now is only one pipeline for synthetic dataset creation, configured during the run or in the parameter file
@@ -9,9 +9,22 @@ def synth_test_data_pipeline(**kwargs):
         [
             node(
                 func=arrange_synth_test_data,
-                inputs="parameters",
+                inputs=["parameters", "synth_test_data"],
                 outputs=["y", "X", "w", "y_true", "features_mask"],
                 name="synth_test_data_node",
             ),
         ]
     )
+
+
+def synth_grouped_data_pipeline(**kwargs):
+    return Pipeline(
+        [
+            node(
+                func=arrange_synth_grouped_data,
+                inputs=["parameters", "synth_test_data"],
+                outputs=["y", "X", "w", "y_true", "features_mask", "groups_labels"],
+                name="synth_grouped_data_node",
+            ),
+        ]
+    )
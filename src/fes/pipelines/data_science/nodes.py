@@ -1,10 +1,11 @@
 import numpy as np
 
 from sklearn.linear_model import LinearRegression
-from sklearn.inspection import permutation_importance
 from sklearn.metrics import mean_squared_error, r2_score
 
-from fes.methods.iht import l0_reg
+from fes.methods.iht import l0_path
+from fes.methods.permutation_importance import permutation_importance
+from fes.methods.ista_sght import sght_reg, get_groups_support
 
 
 def fit_model(y, X):
@@ -37,15 +38,25 @@ def evaluate_perm_importance(regressor, y, X, w, y_true, features_mask, paramete
     pi_parameters = {k: parameters[k] for k in parameters["evaluation_params_list"]["perm_importance"]}
 
     n_repeats = pi_parameters['n_repeats']
+    n_jobs = pi_parameters['n_jobs']
+    batched = pi_parameters['batched']
+
+    # The permutations and the sampled scores are reproducible for a seed without the global random state
+    random_state = np.random.RandomState(pi_parameters['seed'])
     explanation_rate = parameters['explanation_rate']
 
     print(f"Evaluation on sparse test data with permutation importance", end='\n\n')
 
     true_num_features = show_oracle_estimate(y, y_true, features_mask)
 
-    results = permutation_importance(regressor, X, y, n_repeats=n_repeats)
+    # Permutations need X in memory, an ImplicitDesign is materialized here
+    X = np.asarray(X)
+
+    # Linear regressors are scored without calling predict, others with stacked predictions or on n_jobs processes
+    results = permutation_importance(regressor, X, y, n_repeats=n_repeats, n_jobs=n_jobs, batched=batched,
+                                     random_state=random_state)
 
-    importances_scores = np.random.normal(results.importances_mean, results.importances_std)
+    importances_scores = random_state.normal(results.importances_mean, results.importances_std)
     sorted_is_idx = np.argsort(importances_scores)[::-1]
 
     # Feature selection with known number of informative features
@@ -90,20 +101,81 @@ def evaluate_iht(y, X, w, y_true, features_mask, parameters):
     tol = iht_parameters['tol']
     max_iter = iht_parameters['max_iter']
     verbose = iht_parameters['verbose']
+    engine = iht_parameters['engine']
+    method = iht_parameters['iht_method']
+    step_size = iht_parameters['iht_step_size']
 
     print(f"Evaluation on sparse test data with IHT", end='\n\n')
 
     true_num_features = show_oracle_estimate(y, y_true, features_mask)
 
+    # Both support sizes are solved along one warm started path, which raises like l0_reg if IHT doesn't converge
+    W, _, _, _ = l0_path(X, y, [true_num_features, k], tol=tol, max_iter=max_iter, verbose=verbose, engine=engine,
+                         strict=True, method=method, step_size=step_size)
+
     # Feature selection with known number of informative features
-    w_hat_top, sup_hat_top = l0_reg(X, y, true_num_features, tol=tol, max_iter=max_iter, verbose=verbose)
+    w_hat_top = W[:, [0]]
+
+    y_hat_top = X @ w_hat_top
+
+    show_top_k_estimate(true_num_features, y, y_hat_top)
+
+    # Feature selection with unknown number of informative features
+    w_er = W[:, [1]]
+
+    sorted_norm_idx = np.argsort(abs(w_er).reshape(-1))[::-1]
+    norm_cum_sum = np.cumsum(abs(w_er[sorted_norm_idx]).reshape(-1))
+    features_hat_idx_mask = norm_cum_sum <= norm_cum_sum[-1] * explanation_rate
+    features_hat_idx = sorted_norm_idx[features_hat_idx_mask]
+
+    w_hat_er = np.zeros_like(w)
+    w_hat_er[features_hat_idx] = w_er[features_hat_idx]
+
+    y_hat_er = X @ w_hat_er
+
+    show_exp_rate_estimate(explanation_rate, features_hat_idx, y, y_hat_er)
+
+
+def evaluate_sght(y, X, w, y_true, features_mask, groups_labels, parameters):
+    """
+    Parameters
+    ----------
+    y: (n,1) vector of observations
+    X: (n,m) design matrix
+    w: (m,1) vector of true coefficients
+    y_true: (n,1) vector of noiseless observations
+    features_mask: (m,1) informative features mask
+    groups_labels: (m,1) group label of every feature
+    parameters
+    """
+    sght_parameters = {k: parameters[k] for k in parameters["evaluation_params_list"]["sght"]}
+
+    explanation_rate = sght_parameters['explanation_rate']
+
+    k = sght_parameters['k']
+    k_groups = sght_parameters['k_groups']
+    tol = sght_parameters['tol']
+    max_iter = sght_parameters['max_iter']
+    verbose = sght_parameters['verbose']
+
+    print("Evaluation on grouped test data with ISTA SGHT", end='\n\n')
+
+    true_num_features = show_oracle_estimate(y, y_true, features_mask)
+    true_num_groups = len(get_groups_support(features_mask.reshape(-1), groups_labels))
+
+    print(f"True number of informative groups: {true_num_groups}", end='\n\n')
+
+    # Feature selection with known number of informative features and groups
+    w_hat_top, sup_hat_top = sght_reg(X, y, groups_labels, true_num_features, true_num_groups,
+                                      tol=tol, max_iter=max_iter, verbose=verbose)
 
     y_hat_top = X @ w_hat_top
 
     show_top_k_estimate(true_num_features, y, y_hat_top)
+    print(f"Number of proposed groups: {len(get_groups_support(sup_hat_top, groups_labels))}", end='\n\n')
 
     # Feature selection with unknown number of informative features
-    w_er, _ = l0_reg(X, y, k, tol=tol, max_iter=max_iter, verbose=verbose)
+    w_er, _ = sght_reg(X, y, groups_labels, k, k_groups, tol=tol, max_iter=max_iter, verbose=verbose)
 
     sorted_norm_idx = np.argsort(abs(w_er).reshape(-1))[::-1]
     norm_cum_sum = np.cumsum(abs(w_er[sorted_norm_idx]).reshape(-1))
@@ -116,6 +188,8 @@ def evaluate_iht(y, X, w, y_true, features_mask, parameters):
     y_hat_er = X @ w_hat_er
 
     show_exp_rate_estimate(explanation_rate, features_hat_idx, y, y_hat_er)
+    print(f"Number of proposed groups: {len(get_groups_support(w_hat_er.reshape(-1) != 0, groups_labels))}",
+          end='\n\n')
 
 
 """
@@ -1,7 +1,7 @@
 from kedro.pipeline import Pipeline, node
 
 from .nodes import fit_model, evaluate_perm_importance
-from .nodes import evaluate_iht
+from .nodes import evaluate_iht, evaluate_sght
 
 
 def perm_importance_pipeline(**kwargs):
@@ -32,3 +32,14 @@ def iht_pipeline(**kwargs):
             name="evaluate_iht_node"
         )
     ])
+
+
+def sght_pipeline(**kwargs):
+    return Pipeline([
+        node(
+            func=evaluate_sght,
+            inputs=["y", "X", "w", "y_true", "features_mask", "groups_labels", "parameters"],
+            outputs=None,
+            name="evaluate_sght_node"
+        )
+    ])
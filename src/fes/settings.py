@@ -27,10 +27,12 @@
 # limitations under the License.
 
 """Project settings."""
-from .hooks import ProjectHooks
+from .hooks import ProfilingHooks, ProjectHooks
 
-# Instantiate and list your project hooks here
-HOOKS = (ProjectHooks(),)
+# Instantiate and list your project hooks here.
+# ProfilingHooks(enabled=True) profiles every run, otherwise only the runs
+# started with --params profile:1
+HOOKS = (ProjectHooks(), ProfilingHooks())
 
 # List the installed plugins for which to disable auto-registry
 # DISABLE_HOOKS_FOR_PLUGINS = ("kedro-viz",)
@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+
+import pytest
+
+from fes.benchmarks.gate import compare, load_baseline, run_gate, save_baseline, PROBLEMS
+from fes.pipelines.data_processing.nodes import DATA_VERSION
+
+
+class TestCompare:
+    def test_thresholds(self):
+        baseline = dict(problem=dict(time=1., n_iter=10, peak_memory=100))
+
+        assert compare(dict(problem=dict(time=1.4, n_iter=11, peak_memory=110)), baseline) == []
+        assert compare(dict(problem=dict(time=1.6, n_iter=12, peak_memory=90)), baseline) == [
+            ('problem', 'n_iter', 10, 12)]
+
+    def test_time_opt_in(self):
+        baseline = dict(problem=dict(time=1.))
+
+        # Wall times are advisory unless a threshold is given
+        assert compare(dict(problem=dict(time=3.)), baseline) == []
+        assert compare(dict(problem=dict(time=1.6)), baseline, dict(time=0.5)) == [('problem', 'time', 1., 1.6)]
+        assert compare(dict(problem=dict(time=1.6)), baseline, dict(time=1.)) == []
+
+    def test_missing(self):
+        assert compare(dict(new_problem=dict(time=1.), problem=dict(time=1.)), dict(problem=dict())) == []
+
+    def test_baseline(self):
+        assert set(load_baseline()) == set(PROBLEMS)
+
+    def test_stale_baseline(self, tmp_path):
+        baseline = dict(problem=dict(n_iter=10))
+
+        save_baseline(baseline, tmp_path / "baseline.json")
+
+        assert load_baseline(tmp_path / "baseline.json") == baseline
+
+        # A baseline measured on other synthetic data isn't compared
+        with open(tmp_path / "stale.json", "w") as f:
+            json.dump(dict(data_version=DATA_VERSION - 1, metrics=baseline), f)
+
+        with pytest.raises(RuntimeError, match="stale"):
+            load_baseline(tmp_path / "stale.json")
+
+
+@pytest.mark.skipif(not os.environ.get('FES_PERF_GATE'), reason="Wall times depend on the machine, set FES_PERF_GATE=1")
+def test_regression_gate():
+    if sys.gettrace() is not None:
+        pytest.skip("Wall times under coverage are not comparable with the baseline, run with --no-cov")
+
+    regressions = compare(run_gate(), load_baseline())
+
+    assert not regressions, regressions
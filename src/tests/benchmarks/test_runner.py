@@ -0,0 +1,56 @@
+import json
+import types
+
+from fes.benchmarks.runner import RESULTS_DIR, run_benchmarks, save_results
+
+
+def make_suites():
+    module = types.ModuleType("fake_suites")
+
+    class Suite:
+        params = [[1, 2], ['a', 'b']]
+        param_names = ['size', 'kind']
+
+        def setup(self, size, kind):
+            if kind == 'b' and size == 2:
+                raise NotImplementedError
+
+            self.data = [0] * size
+
+        def time_sum(self, size, kind):
+            sum(self.data)
+
+        def track_size(self, size, kind):
+            return len(self.data)
+
+    Suite.__module__ = module.__name__
+    module.Suite = Suite
+
+    return module
+
+
+class TestRunner:
+    def test_grid(self):
+        results = run_benchmarks(repeat=1, min_time=0, module=make_suites())
+
+        assert [result['params'] for result in results['Suite.track_size']] == [
+            dict(size=1, kind='a'), dict(size=1, kind='b'), dict(size=2, kind='a')]
+        assert [result['value'] for result in results['Suite.track_size']] == [1, 1, 2]
+        assert all(result['time'] > 0 and result['peak_memory'] >= 0 for result in results['Suite.time_sum'])
+
+    def test_pattern_and_merge(self, tmp_path):
+        module = make_suites()
+
+        path = save_results(run_benchmarks('time_', repeat=1, min_time=0, module=module), tmp_path)
+        path = save_results(run_benchmarks('track_', repeat=1, min_time=0, module=module), tmp_path)
+
+        with open(path) as f:
+            stored = json.load(f)
+
+        assert sorted(stored['results']) == ['Suite.time_sum', 'Suite.track_size']
+        assert stored['commit'] == path.stem
+
+    def test_results_dir(self):
+        # The results land in the data directory of the project root whatever the working directory
+        assert RESULTS_DIR.is_absolute()
+        assert (RESULTS_DIR.parents[2] / "src" / "fes" / "benchmarks" / "runner.py").is_file()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("kedro")
+
+from fes.datasets.synthetic_dataset import SyntheticDataset, get_key, VERSION
+from fes.pipelines.data_processing.nodes import generate_sparse_data
+
+NAMES = ["y", "X", "w", "y_true", "features_mask"]
+
+PARAMETERS = dict(n=50, m=40, noise_std=1, redundancy_rate=0.5, features_fill='normal', poly_degree=1, seed=3)
+
+
+class TestSyntheticDataset:
+    def test_generates_once(self, tmp_path):
+        calls = []
+
+        def generate_sparse(**parameters):
+            calls.append(parameters)
+            return generate_sparse_data(**parameters)
+
+        cache = SyntheticDataset(str(tmp_path)).load()
+
+        cold = cache.get_or_generate(generate_sparse, PARAMETERS, NAMES)
+        warm = cache.get_or_generate(generate_sparse, dict(reversed(list(PARAMETERS.items()))), NAMES)
+
+        assert len(calls) == 1
+
+        for cold_array, warm_array, array in zip(cold, warm, generate_sparse_data(**PARAMETERS)):
+            assert isinstance(warm_array, np.memmap)
+            np.testing.assert_array_equal(warm_array, array)
+            np.testing.assert_array_equal(cold_array, array)
+
+    def test_keys(self, tmp_path):
+        assert get_key("a", PARAMETERS) != get_key("b", PARAMETERS)
+        assert get_key("a", PARAMETERS) != get_key("a", dict(PARAMETERS, seed=4))
+        assert get_key("a", PARAMETERS) != get_key("a", PARAMETERS, version=VERSION + 1)
+
+    def test_no_seed_is_not_cached(self, tmp_path):
+        cache = SyntheticDataset(str(tmp_path)).load()
+
+        cache.get_or_generate(generate_sparse_data, dict(PARAMETERS, seed=None), NAMES)
+
+        assert not list(tmp_path.iterdir())
+
+    def test_save(self, tmp_path):
+        dataset = SyntheticDataset(str(tmp_path))
+        arrays = dict(zip(NAMES, generate_sparse_data(**PARAMETERS)))
+
+        dataset.save(("generate_sparse_data", PARAMETERS, arrays))
+
+        loaded = dataset.load().get("generate_sparse_data", PARAMETERS)
+
+        for name in NAMES:
+            np.testing.assert_array_equal(loaded[name], arrays[name])
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from fes.methods.design import RowBlockDesign, TransposedDesign
+
+
+class ArrayDesign(RowBlockDesign):
+    def __init__(self, X, block_rows):
+        self.X = X
+        self.shape = X.shape
+        self.dtype = X.dtype
+        self.block_rows = block_rows
+
+    def iter_blocks(self):
+        for start in range(0, self.shape[0], self.block_rows):
+            stop = min(start + self.block_rows, self.shape[0])
+
+            yield start, stop, self.X[start:stop]
+
+
+class TestRowBlockDesign:
+    def test_products(self):
+        X = np.random.RandomState(3).standard_normal((70, 12))
+        X_blocks = ArrayDesign(X, block_rows=16)
+
+        v = np.arange(12, dtype=float).reshape(-1, 1)
+        r = np.arange(70, dtype=float).reshape(-1, 1)
+        idx = np.array([0, 4, 11])
+
+        assert isinstance(X_blocks.T, TransposedDesign) and X_blocks.T.T is X_blocks
+        assert X_blocks.T.shape == (12, 70)
+
+        np.testing.assert_allclose(X_blocks @ v, X @ v)
+        np.testing.assert_allclose(X_blocks.T @ r, X.T @ r)
+        np.testing.assert_allclose(X_blocks.T @ X_blocks, X.T @ X)
+        np.testing.assert_allclose(X_blocks[:, idx], X[:, idx])
+        np.testing.assert_allclose(X_blocks[:, 2:5], X[:, 2:5])
+        np.testing.assert_allclose(X_blocks.support_product(idx, v[:3]), X[:, idx] @ v[:3])
+
+    def test_integer_gram(self):
+        X = np.random.RandomState(4).randint(-128, 128, size=(300, 6)).astype(np.int8)
+
+        np.testing.assert_array_equal(ArrayDesign(X, block_rows=50).gram(), X.astype(float).T @ X.astype(float))
+
+    @pytest.mark.parametrize("key", [0, (0, 1), (slice(0, 5), 1), np.s_[:, :, 1]])
+    def test_only_column_gathers(self, key):
+        with pytest.raises(IndexError):
+            ArrayDesign(np.ones((4, 3)), block_rows=2)[key]
@@ -0,0 +1,406 @@
+import gc
+import tracemalloc
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from fes.methods.iht import l0_reg, l0_path, l0_reg_multi, make_engine, DirectEngine, GramEngine
+from fes.methods.iht import Workspace, CholeskyCache, delete_column, get_difference, get_lipschitz, get_topk_idx
+from fes.methods.iht import iht_step, lipschitz_cache
+from fes.methods.telemetry import Trace
+
+
+@pytest.fixture
+def tall_problem():
+    rng = np.random.RandomState(0)
+    n, m, k = 400, 60, 5
+
+    X = rng.standard_normal((n, m))
+    w = np.zeros((m, 1))
+    w[rng.choice(m, k, replace=False)] = rng.standard_normal((k, 1)) + 3
+    y = X @ w + 0.1 * rng.standard_normal((n, 1))
+
+    return X, y, w, k
+
+
+class TestEngines:
+    def test_auto_engine(self, tall_problem):
+        X, y, _, _ = tall_problem
+
+        assert isinstance(make_engine(X, y), GramEngine)
+        assert isinstance(make_engine(X, y, memory_budget=0), DirectEngine)
+        assert isinstance(make_engine(X.T, X.T[:, :1]), DirectEngine)
+
+    def test_gram_matches_direct(self, tall_problem):
+        X, y, w, k = tall_problem
+
+        w_direct, sup_direct = l0_reg(X, y, k, engine='direct')
+        w_gram, sup_gram = l0_reg(X, y, k, engine='gram')
+
+        np.testing.assert_allclose(w_gram, w_direct, atol=1e-8)
+        np.testing.assert_array_equal(sup_gram, sup_direct)
+        np.testing.assert_array_equal(sup_gram, w.reshape(-1) != 0)
+
+    def test_integer_design(self):
+        rng = np.random.RandomState(7)
+        n, m, k = 300, 40, 5
+
+        # The entries of X.T @ X are far out of the int8 range
+        X = rng.randint(-100, 100, size=(n, m)).astype(np.int8)
+        w = np.zeros((m, 1))
+        w[:k] = 1
+        y = X @ w + rng.standard_normal((n, 1))
+
+        assert isinstance(make_engine(X, y), GramEngine)
+
+        w_direct, _ = l0_reg(X, y, k, engine='direct')
+        w_gram, _ = l0_reg(X, y, k, engine='gram')
+
+        np.testing.assert_allclose(w_gram, w_direct, atol=1e-8)
+        X_float = X.astype(float)
+
+        np.testing.assert_allclose(make_engine(X, y, 'direct').gram([0, 1], [2, 3]), X_float[:, :2].T @ X_float[:, 2:4])
+
+    def test_unknown_engine(self, tall_problem):
+        X, y, _, k = tall_problem
+
+        with pytest.raises(ValueError):
+            l0_reg(X, y, k, engine='unknown')
+
+
+class TestCompactIterate:
+    def test_cached_product(self, tall_problem):
+        X, y, _, _ = tall_problem
+        rng = np.random.RandomState(3)
+
+        engine = DirectEngine(X, y)
+
+        idx = np.arange(5)
+
+        for _ in range(5):
+            idx = np.sort(np.concatenate([rng.choice(idx, 3, replace=False),
+                                          rng.choice(np.setdiff1d(np.arange(X.shape[1]), idx), 2, replace=False)]))
+            w = rng.standard_normal((5, 1))
+
+            np.testing.assert_allclose(engine.product(idx, w), X[:, idx] @ w)
+
+    def test_difference(self):
+        idx, w = np.array([1, 3, 5]), np.array([[1.], [2.], [3.]])
+        idx_prev, w_prev = np.array([0, 3, 4]), np.array([[4.], [5.], [6.]])
+
+        diff = get_difference(idx, w, idx_prev, w_prev)
+
+        np.testing.assert_array_equal(np.sort(diff.reshape(-1)), [-6, -4, -3, 1, 3])
+
+
+class TestWorkspace:
+    def test_steady_state_allocations(self):
+        rng = np.random.RandomState(4)
+        n, m, k = 200, 20000, 10
+
+        X = rng.standard_normal((n, m))
+        y = X[:, :k] @ rng.standard_normal((k, 1))
+
+        engine = DirectEngine(X, y)
+        workspace = Workspace(engine)
+
+        idx = get_topk_idx(engine.Xty, k, workspace)
+        w = np.zeros((k, 1))
+        Xw = engine.product(idx, w, out=workspace.Xw_prev)
+
+        def step(_iter):
+            nonlocal idx, w, Xw
+            idx, w, _, _, _ = iht_step(engine, idx, w, Xw, k, _iter, 50, workspace)
+            Xw = workspace.swap()
+
+        step(0)
+
+        tracemalloc.start()
+
+        for _iter in range(1, 5):
+            step(_iter)
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert peak < m * X.itemsize / 4
+
+
+class TestPath:
+    def test_path_matches_support(self, tall_problem):
+        X, y, w, k = tall_problem
+        ks = [2, k, 2 * k]
+
+        W, S, losses, n_iters = l0_path(X, y, ks)
+
+        assert W.shape == S.shape == (X.shape[1], len(ks))
+        np.testing.assert_array_equal(S.sum(axis=0), ks)
+        np.testing.assert_array_equal(S[:, 1], w.reshape(-1) != 0)
+        assert (np.diff(losses) <= 0).all()
+        assert (n_iters > 0).all()
+
+    def test_warm_start_converges_immediately(self, tall_problem):
+        X, y, _, k = tall_problem
+
+        w_cold, _ = l0_reg(X, y, k, tol=1e-8)
+        W, _, _, n_iters = l0_path(X, y, [k, k], tol=1e-8)
+
+        np.testing.assert_allclose(W[:, [1]], w_cold, atol=1e-6)
+        assert n_iters[1] < n_iters[0]
+
+
+class TestMultiTarget:
+    def test_matches_single_target(self, tall_problem):
+        X, y, _, k = tall_problem
+        rng = np.random.RandomState(1)
+
+        Y = np.hstack([y, X[:, :k] @ rng.standard_normal((k, 3)) + rng.standard_normal((X.shape[0], 3))])
+
+        W, S = l0_reg_multi(X, Y, k)
+
+        for t in range(Y.shape[1]):
+            w, sup = l0_reg(X, Y[:, [t]], k, engine='direct')
+
+            np.testing.assert_allclose(W[:, [t]], w, atol=1e-10)
+            np.testing.assert_array_equal(S[:, t], sup)
+
+
+class TestSparseDesign:
+    @pytest.fixture
+    def sparse_problem(self):
+        rng = np.random.RandomState(2)
+        n, m, k = 300, 400, 5
+
+        X = sp.random(n, m, density=0.05, format='csr', random_state=rng)
+        w = np.zeros((m, 1))
+        w[:k] = 10
+        y = X @ w + 0.01 * rng.standard_normal((n, 1))
+
+        return X, y, k
+
+    @pytest.mark.parametrize("fmt", ["csr", "csc", "coo"])
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_matches_dense(self, sparse_problem, fmt, engine):
+        X, y, k = sparse_problem
+
+        w_dense, sup_dense = l0_reg(X.toarray(), y, k, engine=engine)
+        w_sparse, sup_sparse = l0_reg(X.asformat(fmt), y, k, engine=engine)
+
+        np.testing.assert_allclose(w_sparse, w_dense, atol=1e-10)
+        np.testing.assert_array_equal(sup_sparse, sup_dense)
+
+    @pytest.mark.parametrize("dtype", [bool, np.int8])
+    def test_integer_design(self, dtype):
+        rng = np.random.RandomState(8)
+        n, m, k = 2000, 30, 3
+
+        # One-hot encoded categories, the column counts of X.T @ X are far out of the int8 range
+        X = sp.csr_matrix((np.ones(n, dtype=dtype), (np.arange(n), rng.randint(m, size=n))), shape=(n, m))
+        w = np.zeros((m, 1))
+        w[:k] = 2
+        y = X.astype(float) @ w + 0.1 * rng.standard_normal((n, 1))
+
+        w_dense, _ = l0_reg(X.toarray().astype(float), y, k, engine='gram')
+
+        for engine in ['direct', 'gram']:
+            np.testing.assert_allclose(l0_reg(X, y, k, engine=engine)[0], w_dense, atol=1e-8)
+
+    def test_multi_target(self, sparse_problem):
+        X, y, k = sparse_problem
+        Y = np.hstack([y, 2 * y])
+
+        W_dense, _ = l0_reg_multi(X.toarray(), Y, k)
+        W_sparse, _ = l0_reg_multi(X.tocsc(), Y, k)
+
+        np.testing.assert_allclose(W_sparse, W_dense, atol=1e-10)
+
+
+class TestMethods:
+    @pytest.fixture
+    def correlated_problem(self):
+        rng = np.random.RandomState(5)
+        n, m, k = 150, 300, 10
+
+        # Strongly correlated neighbouring features, as in the AR(1) synthetic designs
+        X = np.cumsum(rng.standard_normal((n, m)), axis=1) / np.sqrt(np.arange(1, m + 1))
+        w = np.zeros((m, 1))
+        w[rng.choice(m, k, replace=False)] = 3
+        y = X @ w + rng.standard_normal((n, 1))
+
+        return X, y, k
+
+    @pytest.mark.parametrize("method", ["aiht", "cgiht", "htp"])
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_recovers_support(self, tall_problem, method, engine):
+        X, y, w, k = tall_problem
+
+        _, sup = l0_reg(X, y, k, engine=engine, method=method)
+
+        np.testing.assert_array_equal(sup, w.reshape(-1) != 0)
+
+    @pytest.mark.parametrize("method", ["aiht", "cgiht", "htp"])
+    def test_monotone(self, correlated_problem, method):
+        X, y, k = correlated_problem
+        trace = Trace()
+
+        l0_reg(X, y, k, max_iter=1000, method=method, callback=trace)
+
+        assert (np.diff(trace['loss']) <= 1e-8 * trace['loss'][:-1]).all()
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_htp_least_squares(self, correlated_problem, engine):
+        X, y, k = correlated_problem
+
+        w, sup = l0_reg(X, y, k, engine=engine, method='htp')
+
+        np.testing.assert_allclose(w[sup], np.linalg.lstsq(X[:, sup], y, rcond=None)[0], atol=1e-8)
+
+    def test_unknown_method(self, tall_problem):
+        X, y, _, k = tall_problem
+
+        with pytest.raises(ValueError):
+            l0_reg(X, y, k, method='unknown')
+
+
+class TestLipschitzStep:
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_estimate(self, tall_problem, engine):
+        X, y, _, _ = tall_problem
+
+        L = get_lipschitz(make_engine(X, y, engine))
+
+        assert 0.98 * np.linalg.norm(X, 2) ** 2 <= L <= np.linalg.norm(X, 2) ** 2 * (1 + 1e-12)
+
+    @pytest.mark.parametrize("shape", [(2000, 200), (200, 2000), (500, 1000), (50, 10)])
+    def test_clustered_spectrum(self, shape):
+        # The top eigenvalues of X.T @ X are close for Gaussian X, the power iterations stop short of L there
+        for seed in range(5):
+            X = np.random.default_rng(seed).standard_normal(shape)
+
+            L = get_lipschitz(make_engine(X, np.ones((shape[0], 1)), 'direct'))
+
+            assert 0.98 * np.linalg.norm(X, 2) ** 2 <= L <= np.linalg.norm(X, 2) ** 2 * (1 + 1e-12)
+
+    def test_cached_by_design(self, tall_problem, monkeypatch):
+        X, y, _, k = tall_problem
+        X = X.copy()
+
+        L = get_lipschitz(make_engine(X, y, 'direct'))
+
+        # New engines on the same X, e.g. repeated l0_reg calls, reuse the estimate
+        def fail(*args, **kwargs):
+            raise AssertionError("The estimate is made again")
+
+        monkeypatch.setattr(GramEngine, 'hessian_product', fail)
+        monkeypatch.setattr(DirectEngine, 'hessian_product', fail)
+
+        assert get_lipschitz(make_engine(X, y, 'gram')) == L
+        l0_reg(X, y, k, step_size='lipschitz')
+
+        # The engines are collected with their reference cycles, then the estimate goes with X
+        key = id(X)
+        del X
+        gc.collect()
+
+        assert key not in lipschitz_cache.estimates
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_recovers_support(self, tall_problem, engine):
+        X, y, w, k = tall_problem
+
+        _, sup = l0_reg(X, y, k, engine=engine, step_size='lipschitz')
+
+        np.testing.assert_array_equal(sup, w.reshape(-1) != 0)
+
+    def test_safe_steps(self, tall_problem):
+        X, y, _, k = tall_problem
+        trace = Trace()
+
+        l0_reg(X, y, k, step_size='lipschitz', callback=trace)
+
+        mu, mu_step, changes = trace['mu'], trace['mu_step'], trace['support_changes']
+        safe = mu == 0.9 / get_lipschitz(make_engine(X, y))
+
+        # The safe steps don't backtrack, and the normalized ones are only taken after the support stays the same
+        assert safe[0] and (mu_step[safe] == 0).all()
+        assert (changes[:-1][~safe[1:]] == 0).all()
+        assert (np.diff(trace['loss']) <= 0).all()
+
+    def test_sparse(self, tall_problem):
+        X, y, _, k = tall_problem
+
+        w, _ = l0_reg(X, y, k, engine='direct', step_size='lipschitz')
+        w_sparse, _ = l0_reg(sp.csc_matrix(X), y, k, engine='direct', step_size='lipschitz')
+
+        np.testing.assert_allclose(w_sparse, w)
+
+    def test_unsupported(self, tall_problem):
+        X, y, _, k = tall_problem
+
+        with pytest.raises(ValueError):
+            l0_reg(X, y, k, method='htp', step_size='lipschitz')
+
+        with pytest.raises(ValueError):
+            l0_reg(X, y, k, step_size='unknown')
+
+
+class TestCholeskyCache:
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_matches_least_squares(self, tall_problem, engine):
+        X, y, _, _ = tall_problem
+        rng = np.random.RandomState(6)
+
+        engine = make_engine(X, y, engine)
+
+        idx = np.sort(rng.choice(X.shape[1], 20, replace=False))
+
+        # Few changes are updates, many changes and the changes of support size refactorize
+        for n_changes in [0, 1, 3, 2, 15, 1, 4]:
+            outside = np.setdiff1d(np.arange(X.shape[1]), idx)
+            idx = np.sort(np.concatenate([rng.choice(idx, len(idx) - n_changes, replace=False),
+                                          rng.choice(outside, n_changes + (n_changes == 4), replace=False)]))
+
+            np.testing.assert_allclose(engine.solve(idx), np.linalg.lstsq(X[:, idx], y, rcond=None)[0], atol=1e-10)
+
+    def test_factor_updates(self):
+        rng = np.random.RandomState(8)
+        X = rng.standard_normal((100, 30))
+
+        cache = CholeskyCache(lambda rows, cols: X[:, rows].T @ X[:, cols], X.T @ rng.standard_normal((100, 1)))
+
+        cache.update(np.arange(10))
+
+        # One feature leaves and two enter: the factor is updated in place of being rebuilt
+        idx = np.r_[0:4, 5:10, 20, 25]
+        cache.update(idx)
+
+        assert cache.updates == 3
+        np.testing.assert_array_equal(np.sort(cache.idx), idx)
+        np.testing.assert_allclose(cache.R.T @ cache.R, X[:, cache.idx].T @ X[:, cache.idx], atol=1e-10)
+        np.testing.assert_array_equal(cache.R, np.triu(cache.R))
+
+    def test_delete_column(self):
+        rng = np.random.RandomState(7)
+        A = rng.standard_normal((30, 10))
+
+        R = delete_column(np.linalg.cholesky(A.T @ A).T, 3)
+        A = np.delete(A, 3, axis=1)
+
+        np.testing.assert_allclose(R.T @ R, A.T @ A, atol=1e-10)
+        np.testing.assert_array_equal(R, np.triu(R))
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_dependent_columns(self, tall_problem, engine):
+        X, y, _, _ = tall_problem
+        X = np.hstack([X, X[:, :1]])
+
+        engine = make_engine(X, y, engine)
+
+        # The duplicate of the first column enters a support that has it, the fitted values are still the least
+        # squares ones and the factor is rebuilt on the next support
+        for idx in [np.arange(10), np.r_[0:9, X.shape[1] - 1], np.arange(1, 11)]:
+            w = engine.solve(idx)
+
+            np.testing.assert_allclose(X[:, idx] @ w, X[:, idx] @ np.linalg.lstsq(X[:, idx], y, rcond=None)[0],
+                                       atol=1e-8)
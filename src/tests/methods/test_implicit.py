@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from fes.methods.iht import l0_reg
+from fes.methods.implicit import ImplicitDesign, BLOCK_ROWS
+from fes.pipelines.data_processing.nodes import generate_sparse_data
+
+PARAMETERS = dict(n=2 * BLOCK_ROWS + 37, m=60, noise_std=0.1, redundancy_rate=0.95, features_fill='normal',
+                  poly_degree=1, seed=12)
+
+
+@pytest.fixture(scope="module")
+def problem():
+    y, X, w, _, _ = generate_sparse_data(**PARAMETERS)
+    _, X_implicit, _, _, _ = generate_sparse_data(**PARAMETERS, implicit=True, n_workers=3)
+
+    return y, X, w, X_implicit
+
+
+class TestImplicitDesign:
+    def test_same_matrix(self, problem):
+        _, X, _, X_implicit = problem
+
+        assert isinstance(X_implicit, ImplicitDesign)
+        np.testing.assert_array_equal(np.asarray(X_implicit), X)
+
+    def test_products(self, problem):
+        _, X, _, X_implicit = problem
+        rng = np.random.RandomState(13)
+
+        w = rng.standard_normal((X.shape[1], 2))
+        r = rng.standard_normal((X.shape[0], 2))
+        idx = np.array([3, 10, 41])
+
+        np.testing.assert_allclose(X_implicit @ w, X @ w)
+        np.testing.assert_allclose(X_implicit.T @ r, X.T @ r)
+        np.testing.assert_allclose(X_implicit.T @ X_implicit, X.T @ X)
+        np.testing.assert_array_equal(X_implicit[:, idx], X[:, idx])
+        np.testing.assert_allclose(X_implicit.support_product(idx, w[idx]), X[:, idx] @ w[idx])
+
+    def test_chunks(self, problem):
+        _, X, _, _ = problem
+
+        # A budget of a few rows per thread, so that every block is regenerated in many chunks
+        X_implicit = ImplicitDesign(np.random.SeedSequence(PARAMETERS['seed']).spawn(2)[1], X.shape, n_workers=2,
+                                    memory_budget=2 * 2 * 5 * X.shape[1] * 8)
+
+        assert X_implicit.chunk_rows == 5
+        np.testing.assert_array_equal(np.asarray(X_implicit), X)
+        np.testing.assert_allclose(X_implicit.T @ X_implicit, X.T @ X)
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_l0_reg(self, problem, engine):
+        y, X, w, X_implicit = problem
+        k = int((w != 0).sum())
+
+        w_hat, sup = l0_reg(X_implicit, y, k, max_iter=1000, engine=engine)
+        w_expected, sup_expected = l0_reg(X, y, k, max_iter=1000, engine=engine)
+
+        np.testing.assert_array_equal(sup, sup_expected)
+        np.testing.assert_allclose(w_hat, w_expected, atol=1e-10)
+
+
+class TestCorrelation:
+    @pytest.mark.parametrize("correlation, rho", [("ar1", 0.7), ("ar1", -0.4), ("block", 0.6)])
+    def test_covariance(self, correlation, rho):
+        m, corr_block_size = 12, 5
+
+        X = np.asarray(ImplicitDesign(14, (40000, m), correlation=correlation, rho=rho,
+                                      corr_block_size=corr_block_size))
+
+        i, j = np.indices((m, m))
+
+        if correlation == "ar1":
+            expected = rho ** abs(i - j)
+        else:
+            expected = np.where(i // corr_block_size == j // corr_block_size, rho, 0.)
+            np.fill_diagonal(expected, 1.)
+
+        np.testing.assert_allclose(X.T @ X / X.shape[0], expected, atol=0.03)
+
+    def test_generated_matches_implicit(self):
+        parameters = dict(PARAMETERS, correlation="block", rho=0.5, corr_block_size=7)
+
+        _, X, _, _, _ = generate_sparse_data(**parameters)
+        _, X_implicit, _, _, _ = generate_sparse_data(**parameters, implicit=True)
+
+        np.testing.assert_array_equal(np.asarray(X_implicit), X)
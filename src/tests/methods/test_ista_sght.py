@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from fes.methods.ista_sght import sght, sght_reg, get_groups_support
+
+
+@pytest.fixture
+def grouped_problem():
+    rng = np.random.RandomState(7)
+    n, m, num_groups = 300, 1000, 100
+
+    groups = np.repeat(np.arange(num_groups), m // num_groups)
+
+    w = np.zeros((m, 1))
+    for group in [3, 17, 42]:
+        w[groups == group] = 3 * rng.standard_normal(((groups == group).sum(), 1))
+
+    X = rng.standard_normal((n, m))
+    y = X @ w + 0.1 * rng.standard_normal((n, 1))
+
+    return X, y, w, groups
+
+
+class TestSGHT:
+    def test_projection_constraints(self):
+        rng = np.random.RandomState(8)
+        labels = rng.randint(0, 50, 500)
+        v = rng.standard_normal((500, 1))
+
+        sup_v, sup = sght(v, 40, 5, labels, 50)
+
+        assert sup.sum() <= 40
+        assert len(np.unique(labels[sup])) <= 5
+        np.testing.assert_array_equal(sup_v[sup], v[sup])
+        assert (sup_v[~sup] == 0).all()
+
+    def test_projection_without_group_constraint(self):
+        rng = np.random.RandomState(9)
+        labels = rng.randint(0, 10, 100)
+        v = rng.standard_normal((100, 1))
+
+        _, sup = sght(v, 7, 10, labels, 10)
+
+        np.testing.assert_array_equal(np.flatnonzero(sup), np.sort(np.argsort(-abs(v.reshape(-1)))[:7]))
+
+    def test_recovers_groups(self, grouped_problem):
+        X, y, w, groups = grouped_problem
+
+        w_hat, sup = sght_reg(X, y, groups, 30, 3, max_iter=1000)
+
+        np.testing.assert_array_equal(sup, w.reshape(-1) != 0)
+        np.testing.assert_array_equal(get_groups_support(sup, groups), [3, 17, 42])
+
+    def test_silent(self, grouped_problem, capsys):
+        X, y, _, groups = grouped_problem
+
+        sght_reg(X, y, groups, 30, 3, max_iter=1000)
+
+        assert capsys.readouterr().out == ""
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from fes.methods.iht import l0_reg
+from fes.methods.parallel import PartitionedDesign
+
+
+@pytest.fixture(scope="module")
+def problem():
+    rng = np.random.RandomState(6)
+    n, m, k = 301, 60, 4
+
+    X = rng.standard_normal((n, m))
+    w = np.zeros((m, 1))
+    w[-k:] = 5
+    y = X @ w + 0.1 * rng.standard_normal((n, 1))
+
+    return X, y, k
+
+
+@pytest.fixture(scope="module")
+def design(problem):
+    X, _, _ = problem
+
+    with PartitionedDesign(X, n_workers=3) as X_partitioned:
+        yield X_partitioned
+
+
+class TestPartitionedDesign:
+    def test_products(self, problem, design):
+        X, y, _ = problem
+
+        v = np.arange(X.shape[1], dtype=float).reshape(-1, 1)
+        idx = np.array([0, 2, 9])
+
+        np.testing.assert_allclose(design @ v, X @ v)
+        np.testing.assert_allclose(design.T @ y, X.T @ y)
+        np.testing.assert_allclose(design.T @ design, X.T @ X)
+        np.testing.assert_allclose(design[:, idx], X[:, idx])
+        np.testing.assert_allclose(design.support_product(idx, v[:3]), X[:, idx] @ v[:3])
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_matches_in_memory(self, problem, design, engine):
+        X, y, k = problem
+
+        w_memory, sup_memory = l0_reg(X, y, k, engine=engine)
+        w_partitioned, sup_partitioned = l0_reg(design, y, k, engine=engine)
+
+        np.testing.assert_allclose(w_partitioned, w_memory, atol=1e-10)
+        np.testing.assert_array_equal(sup_partitioned, sup_memory)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.inspection import permutation_importance as sklearn_permutation_importance
+from sklearn.linear_model import LinearRegression
+
+from fes.methods.permutation_importance import (permutation_importance, expected_linear_importance, is_linear,
+                                                iter_permutation_scores)
+
+
+@pytest.fixture
+def linear_problem():
+    rng = np.random.RandomState(11)
+    n, m = 200, 30
+
+    X = rng.standard_normal((n, m)) + rng.uniform(-1, 1, m)
+    w = rng.standard_normal((m, 1)) * (rng.uniform(size=(m, 1)) < 0.3)
+    y = X @ w + 0.5 * rng.standard_normal((n, 1))
+
+    return X, y
+
+
+class TestLinearFastPath:
+    @pytest.mark.parametrize("fit_intercept", [False, True])
+    def test_matches_sklearn(self, linear_problem, fit_intercept):
+        X, y = linear_problem
+        regressor = LinearRegression(fit_intercept=fit_intercept).fit(X, y)
+
+        assert is_linear(regressor, X, y)
+
+        results = permutation_importance(regressor, X, y, n_repeats=10, random_state=3)
+        expected = sklearn_permutation_importance(regressor, X, y, n_repeats=10, random_state=3)
+
+        np.testing.assert_allclose(results.importances, expected.importances, atol=1e-12)
+        np.testing.assert_allclose(results.importances_mean, expected.importances_mean, atol=1e-12)
+        np.testing.assert_allclose(results.importances_std, expected.importances_std, atol=1e-12)
+
+    def test_expected_importance(self, linear_problem):
+        X, y = linear_problem
+        regressor = LinearRegression().fit(X, y)
+
+        results = permutation_importance(regressor, X, y, n_repeats=2000, random_state=4)
+
+        np.testing.assert_allclose(expected_linear_importance(regressor, X, y), results.importances_mean,
+                                   atol=5 * results.importances_std.max() / np.sqrt(2000))
+
+    def test_falls_back_to_sklearn(self, linear_problem):
+        X, y = linear_problem
+        regressor = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, y.reshape(-1))
+
+        assert not is_linear(regressor, X, y)
+
+        results = permutation_importance(regressor, X, y.reshape(-1), n_repeats=3, random_state=5)
+        expected = sklearn_permutation_importance(regressor, X, y.reshape(-1), n_repeats=3, random_state=5)
+
+        np.testing.assert_array_equal(results.importances, expected.importances)
+
+
+class TestBatched:
+    @pytest.mark.parametrize("memory_budget", [1, 2 ** 20])
+    def test_matches_sklearn(self, linear_problem, memory_budget):
+        X, y = linear_problem
+        regressor = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, y.reshape(-1))
+
+        results = permutation_importance(regressor, X, y, n_repeats=3, random_state=9, batched=True,
+                                         memory_budget=memory_budget)
+        expected = sklearn_permutation_importance(regressor, X, y.reshape(-1), n_repeats=3, random_state=9)
+
+        np.testing.assert_allclose(results.importances, expected.importances, atol=1e-12)
+
+
+class TestParallel:
+    def test_matches_sklearn(self, linear_problem):
+        X, y = linear_problem
+        regressor = RandomForestRegressor(n_estimators=5, random_state=0).fit(X, y.reshape(-1))
+
+        results = permutation_importance(regressor, X, y.reshape(-1), n_repeats=4, random_state=6, n_jobs=2)
+        expected = sklearn_permutation_importance(regressor, X, y.reshape(-1), n_repeats=4, random_state=6)
+
+        np.testing.assert_allclose(results.importances, expected.importances, atol=1e-12)
+
+    def test_streams_every_task(self, linear_problem):
+        X, y = linear_problem
+        regressor = RandomForestRegressor(n_estimators=2, random_state=0).fit(X, y.reshape(-1))
+
+        tasks = [(j, repeats.start, len(scores)) for j, repeats, scores in
+                 iter_permutation_scores(regressor, X, y.reshape(-1), n_repeats=5, random_state=7, n_workers=2,
+                                         repeats_per_task=2)]
+
+        assert sorted(tasks) == [(j, start, min(2, 5 - start)) for j in range(X.shape[1]) for start in (0, 2, 4)]
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from fes.methods.iht import l0_reg, l0_reg_multi
+from fes.methods.streaming import ChunkedDesign
+
+
+@pytest.fixture
+def stored_problem(tmp_path):
+    rng = np.random.RandomState(5)
+    n, m, k = 250, 80, 4
+
+    X = rng.standard_normal((n, m))
+    w = np.zeros((m, 1))
+    w[:k] = 5
+    y = X @ w + 0.1 * rng.standard_normal((n, 1))
+
+    path = tmp_path / "X.npy"
+    np.save(path, X)
+
+    return X, y, k, path
+
+
+class TestChunkedDesign:
+    @pytest.mark.parametrize("prefetch", [True, False])
+    def test_products(self, stored_problem, prefetch):
+        X, y, _, path = stored_problem
+        X_chunked = ChunkedDesign(path, chunk_rows=33, prefetch=prefetch)
+
+        v = np.arange(X.shape[1], dtype=float).reshape(-1, 1)
+        idx = np.array([1, 5, 7])
+
+        np.testing.assert_allclose(X_chunked @ v, X @ v)
+        np.testing.assert_allclose(X_chunked.T @ y, X.T @ y)
+        np.testing.assert_allclose(X_chunked.T @ X_chunked, X.T @ X)
+        np.testing.assert_allclose(X_chunked[:, idx], X[:, idx])
+        np.testing.assert_allclose(X_chunked.support_product(idx, v[:3]), X[:, idx] @ v[:3])
+
+    def test_integer_gram(self, tmp_path):
+        X = np.random.RandomState(9).randint(-100, 100, size=(500, 20)).astype(np.int8)
+
+        path = tmp_path / "X_int.npy"
+        np.save(path, X)
+
+        X_chunked = ChunkedDesign(path, chunk_rows=64)
+        X_float = X.astype(float)
+
+        np.testing.assert_array_equal(X_chunked.T @ X_chunked, X_float.T @ X_float)
+
+    def test_chunk_rows_from_budget(self, stored_problem):
+        X, _, _, path = stored_problem
+
+        assert ChunkedDesign(path, memory_budget=2 * 10 * X.shape[1] * X.itemsize).chunk_rows == 10
+
+    @pytest.mark.parametrize("engine", ["direct", "gram"])
+    def test_matches_in_memory(self, stored_problem, engine):
+        X, y, k, path = stored_problem
+        X_chunked = ChunkedDesign(np.load(path, mmap_mode='r'), chunk_rows=40)
+
+        w_memory, sup_memory = l0_reg(X, y, k, engine=engine)
+        w_chunked, sup_chunked = l0_reg(X_chunked, y, k, engine=engine)
+
+        np.testing.assert_allclose(w_chunked, w_memory, atol=1e-10)
+        np.testing.assert_array_equal(sup_chunked, sup_memory)
+
+    def test_multi_target(self, stored_problem):
+        X, y, k, path = stored_problem
+        Y = np.hstack([y, -y])
+
+        W_memory, _ = l0_reg_multi(X, Y, k)
+        W_chunked, _ = l0_reg_multi(ChunkedDesign(path, chunk_rows=64), Y, k)
+
+        np.testing.assert_allclose(W_chunked, W_memory, atol=1e-10)
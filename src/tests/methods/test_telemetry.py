@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from fes.methods.iht import l0_reg, l0_path, l0_reg_multi, make_engine, run_iht
+from fes.methods.telemetry import Trace, RingBuffer, ProgressPrinter, get_callback
+
+
+@pytest.fixture
+def problem():
+    rng = np.random.RandomState(0)
+    n, m, k = 100, 300, 5
+
+    X = rng.standard_normal((n, m))
+    w = np.zeros((m, 1))
+    w[:k] = 3
+    y = X @ w + 0.1 * rng.standard_normal((n, 1))
+
+    return X, y, k
+
+
+class TestCallbacks:
+    def test_trace(self, problem):
+        X, y, k = problem
+        trace = Trace()
+
+        _, _, _, n_iter = run_iht(make_engine(X, y), k, callback=trace)
+
+        assert len(trace) == n_iter
+        np.testing.assert_array_equal(trace['iteration'], np.arange(n_iter))
+        assert trace['converged'][-1] and not trace['converged'][:-1].any()
+        assert set(trace.records[0]['timings']) >= {'gradient', 'step_size', 'threshold', 'product', 'loss'}
+        assert (trace['timings.gradient'] > 0).all()
+        assert (trace['support_changes'] >= 0).all() and (trace['support_changes'] <= k).all()
+
+    def test_same_solution(self, problem):
+        X, y, k = problem
+
+        w, sup = l0_reg(X, y, k)
+        w_traced, sup_traced = l0_reg(X, y, k, callback=Trace())
+
+        np.testing.assert_array_equal(w_traced, w)
+        np.testing.assert_array_equal(sup_traced, sup)
+
+    def test_ring_buffer(self, problem):
+        X, y, k = problem
+        ring = RingBuffer(size=3, fields=['k', 'iteration', 'loss'])
+
+        l0_path(X, y, [2, k], callback=ring)
+
+        assert len(ring) == 3
+        assert set(ring.records[0]) == {'k', 'iteration', 'loss'}
+        assert ring['k'][-1] == k
+
+    def test_multi_target(self, problem):
+        X, y, k = problem
+        trace = Trace()
+
+        l0_reg_multi(X, np.hstack([y, 2 * y]), k, callback=trace)
+
+        assert trace.records[0]['active'] == 2 and trace.records[0]['loss'].shape == (2,)
+
+
+class TestVerbose:
+    def test_few_iterations(self, problem, capsys):
+        X, y, k = problem
+
+        run_iht(make_engine(X, y), k, max_iter=5, verbose=True, strict=False)
+
+        with pytest.raises(RuntimeError):
+            l0_reg_multi(X, np.hstack([y, 2 * y]), k, max_iter=5, verbose=True)
+
+        assert "Iteration 1," in capsys.readouterr().out
+
+    def test_silent(self, problem, capsys):
+        X, y, k = problem
+
+        run_iht(make_engine(X, y), k)
+        run_iht(make_engine(X, y), k, max_iter=2, strict=False)
+        l0_reg_multi(X, np.hstack([y, 2 * y]), k)
+
+        assert capsys.readouterr().out == ""
+
+    def test_combined(self):
+        trace = Trace()
+        callback = get_callback(trace, verbose=True, max_iter=100)
+
+        assert get_callback(trace) is trace and get_callback() is None
+        assert isinstance(callback.callbacks[1], ProgressPrinter) and callback.callbacks[1].every == 10
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from fes.methods.implicit import get_chunk_rows, BLOCK_ROWS
+from fes.pipelines.data_processing.nodes import generate_sparse_data, generate_grouped_data, arrange_synth_test_data
+
+PARAMETERS = dict(n=1003, m=40, noise_std=1, redundancy_rate=0.5, features_fill='normal', seed=3)
+
+
+class TestSyntheticData:
+    def test_streamed_matches_in_memory(self, tmp_path):
+        expected = generate_sparse_data(**PARAMETERS, poly_degree=1)
+        streamed = generate_sparse_data(**PARAMETERS, poly_degree=1, filepath=str(tmp_path / "X.npy"))
+
+        assert isinstance(streamed[1], np.memmap)
+
+        for array, expected_array in zip(streamed, expected):
+            np.testing.assert_array_equal(array, expected_array)
+
+    def test_independent_of_workers(self):
+        expected = generate_grouped_data(**PARAMETERS, num_groups=5, n_workers=1)
+
+        for n_workers in [2, 7]:
+            for array, expected_array in zip(generate_grouped_data(**PARAMETERS, num_groups=5, n_workers=n_workers),
+                                             expected):
+                np.testing.assert_array_equal(array, expected_array)
+
+    @pytest.mark.parametrize("covariance", [dict(), dict(correlation='ar1', rho=0.5),
+                                            dict(correlation='block', rho=0.5, corr_block_size=7)])
+    def test_independent_of_chunks(self, tmp_path, covariance):
+        expected = generate_sparse_data(**PARAMETERS, poly_degree=1, **covariance)
+
+        for chunk_rows in [1, 100]:
+            for array, expected_array in zip(generate_sparse_data(**PARAMETERS, poly_degree=1, chunk_rows=chunk_rows,
+                                                                  filepath=str(tmp_path / f"X_{chunk_rows}.npy"),
+                                                                  **covariance), expected):
+                np.testing.assert_array_equal(array, expected_array)
+
+    def test_chunks_within_budget(self):
+        # A block of BLOCK_ROWS rows of a million features takes 2 GB, a chunk is kept within the budget
+        assert get_chunk_rows(10 ** 6, 2 ** 27, n_workers=4) * 10 ** 6 * 8 * 2 * 4 <= 2 ** 27
+        assert get_chunk_rows(10 ** 6, 0) == 1
+        assert get_chunk_rows(40, 2 ** 27) == BLOCK_ROWS
+
+    @pytest.mark.parametrize("covariance", [dict(correlation='block', rho=0.5),
+                                            dict(correlation='block', rho=0.5, corr_block_size=0),
+                                            dict(correlation='ar1', rho=1.), dict(correlation='toeplitz')])
+    def test_invalid_covariance(self, covariance):
+        with pytest.raises(ValueError):
+            generate_sparse_data(**PARAMETERS, poly_degree=1, **covariance)
+
+        with pytest.raises(ValueError):
+            generate_sparse_data(**PARAMETERS, poly_degree=1, implicit=True, **covariance)
+
+    def test_seed(self):
+        _, X, w, _, _ = generate_sparse_data(**PARAMETERS, poly_degree=1)
+        _, X_other, w_other, _, _ = generate_sparse_data(**dict(PARAMETERS, seed=4), poly_degree=1)
+
+        assert not np.array_equal(X, X_other)
+        assert not np.array_equal(w, w_other)
+
+    def test_groups(self):
+        _, _, w, _, features_mask, groups_labels = generate_grouped_data(**PARAMETERS, num_groups=7)
+
+        labels = groups_labels.reshape(-1)
+
+        np.testing.assert_array_equal(np.unique(labels), np.arange(1, 8))
+        assert (np.diff(labels) >= 0).all()
+
+        # Groups are kept or dropped whole, and the first one is always kept
+        for label in np.unique(labels):
+            assert features_mask[labels == label].all() or not features_mask[labels == label].any()
+
+        assert features_mask[labels == 1].all()
+
+    def test_sparse_option(self):
+        # The sparse option doesn't need the number of groups
+        parameters = dict(PARAMETERS, option='sparse', poly_degree=1, implicit=False,
+                          synthetic_data_params_list=list(PARAMETERS) + ['option', 'poly_degree', 'implicit'])
+
+        for array, expected_array in zip(arrange_synth_test_data(parameters),
+                                         generate_sparse_data(**PARAMETERS, poly_degree=1)):
+            np.testing.assert_array_equal(array, expected_array)
+
+    def test_grouped_option(self):
+        parameters = dict(PARAMETERS, option='grouped', poly_degree=1, num_groups=5, implicit=False,
+                          synthetic_data_params_list=list(PARAMETERS) + ['option', 'poly_degree', 'implicit'])
+
+        y, X, w, y_true, features_mask = arrange_synth_test_data(parameters)
+
+        for array, expected_array in zip((y, X, w, y_true, features_mask), generate_grouped_data(**PARAMETERS,
+                                                                                                num_groups=5)):
+            np.testing.assert_array_equal(array, expected_array)
@@ -0,0 +1,65 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("kedro")
+
+from kedro.pipeline import node
+
+from fes.hooks import ProfilingHooks, get_size
+
+
+def double(x):
+    return 2 * x
+
+
+def run(hooks, extra_params=None):
+    profiled_node = node(double, "x", "y", name="double")
+    inputs = dict(x=np.ones(100))
+
+    hooks.before_pipeline_run(dict(run_id="run", pipeline_name=None, extra_params=extra_params))
+    hooks.before_node_run(profiled_node, inputs)
+    hooks.after_node_run(profiled_node, dict(y=double(inputs["x"])))
+    hooks.after_pipeline_run()
+
+
+class TestProfilingHooks:
+    def test_disabled(self, tmp_path):
+        run(ProfilingHooks(output_dir=str(tmp_path)))
+
+        assert not list(tmp_path.iterdir())
+
+    def test_params(self, tmp_path):
+        hooks = ProfilingHooks(output_dir=str(tmp_path))
+
+        run(hooks, dict(profile=1))
+        run(hooks, dict(profile=1))
+
+        with open(tmp_path / "run.json") as f:
+            profile = json.load(f)
+
+        assert profile["status"] == "completed"
+        assert [record["node"] for record in profile["nodes"]] == ["double"]
+
+        record = profile["nodes"][0]
+
+        assert record["inputs"] == dict(x=800) and record["outputs"] == dict(y=800)
+        assert record["wall_time"] >= 0 and record["tracemalloc_peak"] >= 800
+
+        with open(tmp_path / "nodes.csv") as f:
+            rows = list(csv.DictReader(f))
+
+        assert len(rows) == 2
+        assert rows[0]["node"] == "double" and rows[0]["input_bytes"] == "800"
+
+    def test_enabled(self, tmp_path):
+        run(ProfilingHooks(enabled=True, trace_memory=False, output_dir=str(tmp_path)))
+
+        with open(tmp_path / "run.json") as f:
+            assert json.load(f)["nodes"][0]["tracemalloc_peak"] is None
+
+
+def test_get_size():
+    assert get_size(dict(a=np.zeros(10), b=[np.zeros(5), np.zeros(5, dtype=np.float32)])) == 140